@@ -1,20 +1,54 @@
 import asyncio
+import contextlib
 import datetime
 import json
 import os
 import sys 
-import copy
+import uuid
+from collections import defaultdict, namedtuple
+from functools import lru_cache
 from typing import List, Dict, Any, Union, Tuple 
+import numpy as np
 
 try:
     import config 
     from backend.vk_parser import parser as vk_parser_module
     from backend.models_inference.pipeline_runner import create_sentiment_pipeline, SentimentPipeline 
     from backend.models_inference.nlp_data_preprocessor import NLPDataPreprocessor
+    from backend.models_inference.pipeline_batcher import PipelineBatcher
 except ImportError as e:
     print(f"APP_LOGIC: Ошибка импорта: {e}")
     sys.exit(1) 
 
+try:
+    import orjson
+    def _to_jsonl_line(record: Dict[str, Any]) -> bytes:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def _to_jsonl_line(record: Dict[str, Any]) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+# Более короткие тексты (после strip) не могут содержать имя персоны и не передаются в NER;
+# что считать именем, решает модель PER
+_MIN_NER_TEXT_LENGTH = 2
+
+def _remove_file_quietly(path: str):
+    """ Удаляет временный файл; отсутствие файла и ошибки удаления игнорируются. """
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+# Запись об одном упоминании персоны; в словарь преобразуется только при сохранении в JSONL
+Mention = namedtuple("Mention", "entity_normalized entity_original polarity date timestamp "
+                                "source_type source_id post_id_if_comment group_name text_preview")
+
+@lru_cache(maxsize=4096)
+def _timestamp_to_date_key(date_ts: int) -> str:
+    """
+    Преобразует Unix-timestamp в строку даты формата "YYYY-MM-DD".
+    Результаты кэшируются, так как у нескольких мнений из одного текста общий timestamp.
+    """
+    return datetime.datetime.fromtimestamp(date_ts).strftime("%Y-%m-%d")
+
 class AnalysisService:
     """
     Полный цикл объектно-ориентированного анализа 
@@ -25,12 +59,17 @@ class AnalysisService:
         Инициализирует сервис анализа.
         """
         try:
-            self.data_preprocessor = NLPDataPreprocessor(max_text_preview_length=getattr(config, 'MAX_TEXT_PREVIEW_LENGTH', 300) )
+            self.data_preprocessor = NLPDataPreprocessor(
+                max_text_preview_length=getattr(config, 'MAX_TEXT_PREVIEW_LENGTH', 300))
         except Exception as e_prep:
             print(f"AnalysisService: Ошибка инициализации NLPDataPreprocessor: {e_prep}")
             raise RuntimeError("Ошибка инициализации препроцессора данных") from e_prep
         try:
             self.nlp_pipeline: SentimentPipeline = create_sentiment_pipeline()
+            self.nlp_batcher = PipelineBatcher(
+                self.nlp_pipeline,
+                max_batch_texts=config.NLP_MAX_BATCH_TEXTS,
+                max_latency_ms=config.NLP_MAX_BATCH_LATENCY_MS)
             print("AnalysisService: SentimentPipeline успешно создан и модели загружены.")
         except Exception as e_pipeline: 
             print(f"AnalysisService: Ошибка инициализации SentimentPipeline: {e_pipeline}")
@@ -41,10 +80,29 @@ class AnalysisService:
         if hasattr(config, 'TESA_ID2LABEL') and config.TESA_ID2LABEL:
             self.tesa_id2label: Dict[int, str] = config.TESA_ID2LABEL
             print(f"AnalysisService: Карта меток TESA загружена из config ({len(self.tesa_id2label)} меток).")
+            self._label_names: Tuple[str, ...] = tuple(self.tesa_id2label.values()) + ("UNKNOWN",)
+            self._polarity_to_idx: Dict[str, int] = {name: idx for idx, name in enumerate(self._label_names)}
+            self._unknown_idx: int = self._polarity_to_idx["UNKNOWN"]
+            self._empty_count_vector: np.ndarray = np.zeros(len(self._label_names), dtype=np.int32)
         else:
             print("AnalysisService: Ошибка: Словарь меток TESA_ID2LABEL не найден.")
             raise ValueError("Карта меток TESA не сконфигурирована.")
 
+    def _new_count_vector(self) -> np.ndarray:
+        """ Возвращает нулевой вектор счетчиков, индексируемый номером тональности из _label_names. """
+        return self._empty_count_vector.copy()
+
+    def _counts_to_vector(self, sentiment_counts: Dict[str, int]) -> np.ndarray:
+        """ Преобразует словарь {тональность: счетчик} в вектор счетчиков. Неизвестные метки учитываются как UNKNOWN. """
+        vector = self._new_count_vector()
+        for polarity, count in sentiment_counts.items():
+            vector[self._polarity_to_idx.get(polarity, self._unknown_idx)] += count
+        return vector
+
+    def _vector_to_counts(self, vector: np.ndarray) -> Dict[str, int]:
+        """ Преобразует вектор счетчиков обратно в словарь {тональность: счетчик}. """
+        return dict(zip(self._label_names, vector.tolist()))
+
     def _aggregate_nlp_results(self, 
                                nlp_results_per_text: List[List[Dict[str, str]]], 
                                metadata_for_nlp: List[Dict[str, Any]]) -> Dict[str, Any]:    
@@ -67,28 +125,32 @@ class AnalysisService:
                   нормализованные имена сущностей. Значения - словари, где ключи -
                   это даты (в формате "YYYY-MM-DD"), а значения - словари с
                   подсчитанным количеством упоминаний для каждой тональности.
-                - "detailed_mentions": Список словарей. Каждый словарь представляет
+                - "detailed_mentions": Список записей Mention. Каждая запись представляет
                   одно упоминание и содержит "entity_normalized", "entity_original",
                   "polarity", а также информацию из metadata_for_nlp.
         """
-        final_aggregated_data: Dict[str, Dict[str, Dict[str, int]]] = {}
-        detailed_mentions: List[Dict[str, Any]] = [] 
+        entity_date_counts: Dict[str, Dict[str, np.ndarray]] = defaultdict(lambda: defaultdict(self._new_count_vector))
+        detailed_mentions: List[Mention] = [None] * sum(len(text_opinions) for text_opinions in nlp_results_per_text)
+        mentions_count = 0
         if len(nlp_results_per_text) != len(metadata_for_nlp):
             print("AnalysisService: Несовпадение длин результатов NLP и метаданных. Агрегация может быть неполной.")
-        for i, text_opinions in enumerate(nlp_results_per_text):
-            if i >= len(metadata_for_nlp): 
-                print(f"AnalysisService: Нет метаданных для текста с индексом {i}, пропуск.")
-                continue             
-            meta = metadata_for_nlp[i]
+        polarity_to_idx = self._polarity_to_idx
+        unknown_idx = self._unknown_idx
+        for i, (text_opinions, meta) in enumerate(zip(nlp_results_per_text, metadata_for_nlp)):
             date_ts = meta.get("date_timestamp")
             if date_ts is None: 
                 print(f"AnalysisService: Отсутствует 'date_timestamp' в метаданных для текста {i}, пропуск.")
                 continue            
             try: 
-                date_key = datetime.datetime.fromtimestamp(date_ts).strftime("%Y-%m-%d")
+                date_key = _timestamp_to_date_key(date_ts)
             except (TypeError, ValueError) as e_date: 
                 print(f"AnalysisService: Некорректный timestamp '{date_ts}' в метаданных для текста {i}: {e_date}. Пропуск записи.")
                 continue
+            source_type = meta.get("source_type")
+            source_id = meta.get("source_id")
+            post_id_parent = meta.get("post_id_parent")
+            group_name = meta.get("group_name")
+            text_preview = meta.get("original_text_preview")
             for opinion_pair in text_opinions:
                 entity_normalized = opinion_pair.get("entity")
                 entity_original = opinion_pair.get("entity_original")
@@ -97,85 +159,89 @@ class AnalysisService:
                 if not entity_normalized or not polarity: 
                     continue 
 
-                if entity_normalized not in final_aggregated_data:
-                    final_aggregated_data[entity_normalized] = {}
+                entity_date_counts[entity_normalized][date_key][polarity_to_idx.get(polarity, unknown_idx)] += 1
                 
-                if date_key not in final_aggregated_data[entity_normalized]:
-                    final_aggregated_data[entity_normalized][date_key] = {
-                        label_name: 0 for label_name in self.tesa_id2label.values()
-                    }
-                    final_aggregated_data[entity_normalized][date_key]["UNKNOWN"] = 0 
-
-                if polarity in final_aggregated_data[entity_normalized][date_key]:
-                    final_aggregated_data[entity_normalized][date_key][polarity] += 1
-                else:
-                    final_aggregated_data[entity_normalized][date_key]["UNKNOWN"] += 1
-                
-                detailed_mentions.append({
-                    "entity_normalized": entity_normalized, 
-                    "entity_original": entity_original,     
-                    "polarity": polarity,
-                    "date": date_key,
-                    "timestamp": date_ts,
-                    "source_type": meta.get("source_type"),
-                    "source_id": meta.get("source_id"),
-                    "post_id_if_comment": meta.get("post_id_parent"), 
-                    "group_name": meta.get("group_name"),
-                    "text_preview": meta.get("original_text_preview") 
-                })
+                detailed_mentions[mentions_count] = Mention(
+                    entity_normalized, entity_original, polarity, date_key, date_ts,
+                    source_type, source_id, post_id_parent, group_name, text_preview)
+                mentions_count += 1
+        del detailed_mentions[mentions_count:]
+        final_aggregated_data: Dict[str, Dict[str, Dict[str, int]]] = {
+            entity: {date_key: self._vector_to_counts(counts) for date_key, counts in dates.items()}
+            for entity, dates in entity_date_counts.items()}
         
         print(f"AnalysisService: Агрегация завершена. Уникальных (нормализованных) сущностей: {len(final_aggregated_data)}, всего упоминаний: {len(detailed_mentions)}.")
         return {"summary_by_entity_date": final_aggregated_data, "detailed_mentions": detailed_mentions}
 
-    def reaggregate_with_aliases(self, 
-                                 current_summary: Dict[str, Dict[str, Dict[str, int]]], 
-                                 current_detailed_mentions: List[Dict[str, Any]], 
-                                 aliases_to_merge: List[str], 
-                                 canonical_name: str) -> Tuple[Dict[str, Dict[str, Dict[str, int]]], List[Dict[str, Any]]]:
+    def merge_summary_aliases(self,
+                              current_summary: Dict[str, Dict[str, Dict[str, int]]],
+                              aliases_to_merge: List[str],
+                              canonical_name: str) -> Dict[str, Dict[str, Dict[str, int]]]:
         """
-        Объединяет данные для нескольких сущностей под одним каноническим именем.
-        
+        Объединяет агрегированную сводку нескольких сущностей под одним каноническим именем.
+        Входная сводка не изменяется.
+
         Args:
             current_summary (Dict[str, Dict[str, Dict[str, int]]]): Текущая агрегированная сводка
                 в формате {сущность: {дата: {тональность: счетчик}}}.
-            current_detailed_mentions (List[Dict[str, Any]]): Текущий список словарей
-                с детализированными упоминаниями.
             aliases_to_merge (List[str]): Список строковых имен сущностей,
                 которые должны быть объединены.
             canonical_name (str): Строковое каноническое имя, под которым
                 будут агрегированы данные алиасов.
 
         Returns:
-            Tuple[Dict[str, Dict[str, Dict[str, int]]], List[Dict[str, Any]]]:
-                Кортеж, содержащий обновленные 'new_summary' и 'new_detailed_mentions'.
+            Dict[str, Dict[str, Dict[str, int]]]: Обновленная сводка.
         """
-        print(f"AnalysisService: Переагрегация с объединением {aliases_to_merge} в '{canonical_name}'...")
         if not canonical_name.strip():
             print("AnalysisService ERROR: Каноническое имя не может быть пустым для переагрегации.")
-            return current_summary, current_detailed_mentions
-        new_summary = copy.deepcopy(current_summary)
-        new_detailed_mentions = copy.deepcopy(current_detailed_mentions)
-        if canonical_name not in new_summary:
-            new_summary[canonical_name] = {}
+            return current_summary
+        new_summary = dict(current_summary)
+        canonical_dates: Dict[str, np.ndarray] = {
+            date_key: self._counts_to_vector(sentiment_counts) for date_key, sentiment_counts in new_summary.get(canonical_name, {}).items()}
         for alias in aliases_to_merge:
             if alias == canonical_name:
                 continue
-            if alias in new_summary:
-                for date_key, sentiment_counts in new_summary[alias].items():
-                    if date_key not in new_summary[canonical_name]:
-                        new_summary[canonical_name][date_key] = {
-                            label: 0 for label in self.tesa_id2label.values()}
-                        new_summary[canonical_name][date_key]["UNKNOWN"] = 0                    
-                    for sentiment, count in sentiment_counts.items():
-                        new_summary[canonical_name][date_key][sentiment] = \
-                            new_summary[canonical_name][date_key].get(sentiment, 0) + count                
-                del new_summary[alias]
-            else:
+            alias_dates = new_summary.pop(alias, None)
+            if alias_dates is None:
                 print(f"AnalysisService WARNING: Объединенная сущность '{alias}' не найдена в текущей сводке для объединения.")
-        for mention in new_detailed_mentions:
-            if mention.get("entity") in aliases_to_merge:
-                mention["entity"] = canonical_name         
-        return new_summary, new_detailed_mentions
+                continue
+            for date_key, sentiment_counts in alias_dates.items():
+                if date_key in canonical_dates:
+                    canonical_dates[date_key] += self._counts_to_vector(sentiment_counts)
+                else:
+                    canonical_dates[date_key] = self._counts_to_vector(sentiment_counts)
+        new_summary[canonical_name] = {date_key: self._vector_to_counts(counts) for date_key, counts in canonical_dates.items()}
+        return new_summary
+
+    def _aggregate_and_save_results(self, nlp_results_per_text: List[List[Dict[str, str]]],
+                                    metadata_for_nlp: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Агрегирует результаты NLP и сохраняет детализированные упоминания в JSONL файл.
+
+        Returns:
+            Dict[str, Any]: Ключи "summary", "detailed_results_file" (None, если файл
+                            не создан) и "detailed_mentions" результата run_full_analysis.
+        """
+        aggregated_and_detailed_results = self._aggregate_nlp_results(nlp_results_per_text, metadata_for_nlp)        
+        detailed_mentions_to_save = aggregated_and_detailed_results.get("detailed_mentions", [])
+        nlp_output_file_path: Union[str, None] = None
+        if detailed_mentions_to_save:
+            try:
+                timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = config.NLP_RESULTS_FILENAME_TEMPLATE.format(timestamp=timestamp_str)
+                nlp_output_file_path = os.path.join(config.NLP_RESULTS_OUTPUT_DIR, filename)                
+                with open(nlp_output_file_path, 'wb', buffering=1024 * 1024) as f_out_nlp:
+                    f_out_nlp.writelines(_to_jsonl_line(mention_record._asdict()) for mention_record in detailed_mentions_to_save)
+                print(f"AnalysisService: Детальные результаты NLP ({len(detailed_mentions_to_save)} упоминаний) сохранены в: {nlp_output_file_path}")
+            except Exception as e_save: 
+                print(f"AnalysisService ERROR: Ошибка сохранения детальных результатов NLP: {e_save}")
+                nlp_output_file_path = None 
+        else:
+            print("AnalysisService: Нет детализированных упоминаний для сохранения.")
+        return {
+            "summary": aggregated_and_detailed_results.get("summary_by_entity_date"),
+            "detailed_results_file": nlp_output_file_path,
+            "detailed_mentions": detailed_mentions_to_save}
 
     async def run_full_analysis(self, group_identifiers_str: str, 
                                 date_start_str: str, date_end_str: str
@@ -195,6 +261,8 @@ class AnalysisService:
                                          Формат: {сущность: {дата: {тональность: счетчик}}}.
                 - "detailed_results_file" (str | None): Путь к файлу JSONL с детализированными
                                                         упоминаниями. None, если файл не был создан.
+                - "detailed_mentions" (List[Mention]): Те же детализированные упоминания в памяти,
+                                                       чтобы вызывающей стороне не читать файл заново.
                 - "message" (str, optional): Информационное сообщение о статусе выполнения.
                 - "error" (str, optional): Сообщение об ошибке, если в процессе анализа
                                          произошла проблема, не позволившая его завершить.
@@ -210,48 +278,45 @@ class AnalysisService:
         except ValueError as e:
             return {"error": f"Неверный формат входных параметров: {e}"}        
         parsed_data_file_path = None
+        # Свой файл парсинга на каждый запуск: анализы из разных сессий UI выполняются одновременно.
+        parsed_base, parsed_ext = os.path.splitext(config.PARSED_DATA_OUTPUT_FILE)
+        parsed_output_file = f"{parsed_base}_{uuid.uuid4().hex}{parsed_ext}"
+        # Файл парсинга удаляется при любом выходе, в т.ч. при отмене запуска (CancelledError).
         try:
-            print(f"AnalysisService: Запуск парсинга для групп: {group_list}, период: {start_date_obj} - {end_date_obj}")
-            parsed_data_file_path = await vk_parser_module.fetch_vk_data(group_list, start_date_obj, end_date_obj)
-            print(f"AnalysisService: Данные VK сохранены в: {parsed_data_file_path}")
-        except Exception as e_parse: 
-            print(f"AnalysisService CRITICAL: Ошибка парсинга данных VK: {e_parse}")
-            return {"error": f"Ошибка парсинга данных VK: {str(e_parse)}"}
-        if not parsed_data_file_path or not os.path.exists(parsed_data_file_path):
-            return {"error": "Файл с результатами парсинга не найден или парсинг не вернул данных."}        
-        try:
-            texts_for_nlp, metadata_for_nlp = self.data_preprocessor.extract_and_prepare_input(parsed_data_file_path)
-        except Exception as e_prep_extract: 
-            print(f"AnalysisService CRITICAL: Ошибка предобработки данных для NLP: {e_prep_extract}")
-            return {"error": f"Ошибка предобработки данных для NLP: {str(e_prep_extract)}"}
+            try:
+                print(f"AnalysisService: Запуск парсинга для групп: {group_list}, период: {start_date_obj} - {end_date_obj}")
+                parsed_data_file_path = await vk_parser_module.fetch_vk_data(
+                    group_list, start_date_obj, end_date_obj, output_file=parsed_output_file)
+                print(f"AnalysisService: Данные VK сохранены в: {parsed_data_file_path}")
+            except Exception as e_parse: 
+                print(f"AnalysisService CRITICAL: Ошибка парсинга данных VK: {e_parse}")
+                return {"error": f"Ошибка парсинга данных VK: {str(e_parse)}"}
+            if not parsed_data_file_path or not os.path.exists(parsed_data_file_path):
+                return {"error": "Файл с результатами парсинга не найден или парсинг не вернул данных."}        
+            try:
+                texts_for_nlp, metadata_for_nlp = await asyncio.to_thread(
+                    self.data_preprocessor.extract_and_prepare_input, parsed_data_file_path)
+            except Exception as e_prep_extract: 
+                print(f"AnalysisService CRITICAL: Ошибка предобработки данных для NLP: {e_prep_extract}")
+                return {"error": f"Ошибка предобработки данных для NLP: {str(e_prep_extract)}"}
+        finally:
+            _remove_file_quietly(parsed_output_file)
         if not texts_for_nlp:
             return {"message": "Парсинг завершен, но не найдено текстов (постов/комментариев) для NLP анализа."}            
-        nlp_results_per_text: List[List[Dict[str, str]]] = []
+        nlp_results_per_text: List[List[Dict[str, str]]] = [[] for _ in texts_for_nlp]
+        ner_candidate_indices = [idx for idx, text in enumerate(texts_for_nlp) if len(text.strip()) >= _MIN_NER_TEXT_LENGTH]
         try:
-            print(f"AnalysisService: Запуск NLP пайплайна для {len(texts_for_nlp)} текстов...")
-            nlp_results_per_text = self.nlp_pipeline.run(texts_for_nlp) 
+            print(f"AnalysisService: Запуск NLP пайплайна для {len(ner_candidate_indices)} из {len(texts_for_nlp)} текстов "
+                  f"(остальные короче {_MIN_NER_TEXT_LENGTH} симв.)...")
+            if ner_candidate_indices:
+                candidate_results = await self.nlp_batcher.run([texts_for_nlp[idx] for idx in ner_candidate_indices])
+                for idx, text_result in zip(ner_candidate_indices, candidate_results):
+                    nlp_results_per_text[idx] = text_result
             print("AnalysisService: NLP пайплайн завершен.")
         except Exception as e_nlp: 
             print(f"AnalysisService CRITICAL: Ошибка NLP анализа: {e_nlp}")
             return {"error": f"Ошибка NLP анализа: {str(e_nlp)}"}
-        aggregated_and_detailed_results = self._aggregate_nlp_results(nlp_results_per_text, metadata_for_nlp)        
-        detailed_mentions_to_save = aggregated_and_detailed_results.get("detailed_mentions", [])
-        nlp_output_file_path: Union[str, None] = None
-        if detailed_mentions_to_save:
-            try:
-                timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = config.NLP_RESULTS_FILENAME_TEMPLATE.format(timestamp=timestamp_str)
-                nlp_output_file_path = os.path.join(config.NLP_RESULTS_OUTPUT_DIR, filename)                
-                with open(nlp_output_file_path, 'w', encoding='utf-8') as f_out_nlp:
-                    for mention_record in detailed_mentions_to_save:
-                        f_out_nlp.write(json.dumps(mention_record, ensure_ascii=False) + '\n')
-                print(f"AnalysisService: Детальные результаты NLP ({len(detailed_mentions_to_save)} упоминаний) сохранены в: {nlp_output_file_path}")
-            except Exception as e_save: 
-                print(f"AnalysisService ERROR: Ошибка сохранения детальных результатов NLP: {e_save}")
-                nlp_output_file_path = None 
-        else:
-            print("AnalysisService: Нет детализированных упоминаний для сохранения.")            
-        return {
-            "summary": aggregated_and_detailed_results.get("summary_by_entity_date"),
-            "detailed_results_file": nlp_output_file_path,
-            "message": "Анализ успешно завершен."}
\ No newline at end of file
+        # Агрегация и запись JSONL выполняются в потоке: общий цикл событий UI не блокируется.
+        analysis_output = await asyncio.to_thread(self._aggregate_and_save_results, nlp_results_per_text, metadata_for_nlp)
+        analysis_output["message"] = "Анализ успешно завершен."
+        return analysis_output
\ No newline at end of file
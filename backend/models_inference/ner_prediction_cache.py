@@ -0,0 +1,96 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Union
+
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    _json_loads = json.loads
+
+class NERPredictionCache:
+    """
+    Дисковый кэш предсказаний NER на базе SQLite.
+    Ключ - хэш текста (blake2b), значение - список найденных персон в JSON.
+    """
+    _SQLITE_MAX_VARIABLES = 900
+
+    def __init__(self, db_path: str, namespace: str = "", max_rows: Union[int, None] = None):
+        """
+        Инициализирует кэш и создает таблицу при необходимости.
+
+        Args:
+            db_path (str): Путь к файлу базы данных SQLite.
+            namespace (str, optional): Пространство имен ключей (например, имя и версия файла весов модели),
+                                       чтобы результаты разных моделей не смешивались.
+            max_rows (Union[int, None], optional): Предельное число записей. При открытии кэша
+                                                   самые старые записи сверх лимита удаляются.
+        """
+        self.db_path = db_path
+        # Ключ blake2b ограничен 64 байтами: длинное пространство имен сводится к его хэшу без усечения
+        self._hash_key = hashlib.blake2b(namespace.encode('utf-8'), digest_size=32).digest() if namespace else b""
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS ner_cache (hash BLOB PRIMARY KEY, entities BLOB NOT NULL)")
+        if max_rows is not None:
+            self._trim(max_rows)
+        print(f"NERPredictionCache: Кэш NER подключен: {db_path}")
+
+    def _trim(self, max_rows: int):
+        """
+        Удаляет самые старые записи сверх max_rows. INSERT OR REPLACE выдает перезаписанной
+        записи новый rowid, поэтому порядок rowid соответствует времени последней записи.
+        """
+        with self._lock, self._connection:
+            (rows_count,) = self._connection.execute("SELECT COUNT(*) FROM ner_cache").fetchone()
+            excess = rows_count - max_rows
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM ner_cache WHERE rowid IN (SELECT rowid FROM ner_cache ORDER BY rowid LIMIT ?)", (excess,))
+                print(f"NERPredictionCache: Удалено {excess} старых записей кэша (лимит {max_rows}).")
+
+    def _hash_text(self, text: str) -> bytes:
+        """ Возвращает 16-байтовый хэш текста. """
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16, key=self._hash_key).digest()
+
+    def get_many(self, text_list: List[str]) -> List[Union[List[Dict[str, str]], None]]:
+        """
+        Ищет сохраненные предсказания для списка текстов.
+
+        Args:
+            text_list (List[str]): Список текстов.
+
+        Returns:
+            List[Union[List[Dict[str, str]], None]]: Предсказание для каждого текста
+                                                     или None, если текста нет в кэше.
+        """
+        hashes = [self._hash_text(text) for text in text_list]
+        found: Dict[bytes, bytes] = {}
+        unique_hashes = list(set(hashes))
+        with self._lock:
+            for i in range(0, len(unique_hashes), self._SQLITE_MAX_VARIABLES):
+                chunk = unique_hashes[i:i + self._SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT hash, entities FROM ner_cache WHERE hash IN ({placeholders})", chunk).fetchall()
+                found.update(rows)
+        return [_json_loads(found[h]) if h in found else None for h in hashes]
+
+    def put_many(self, text_list: List[str], predictions: List[List[Dict[str, str]]]):
+        """
+        Сохраняет предсказания для списка текстов.
+
+        Args:
+            text_list (List[str]): Список текстов.
+            predictions (List[List[Dict[str, str]]]): Предсказания, соответствующие текстам.
+        """
+        rows = [(self._hash_text(text), _json_dumps(entities)) for text, entities in zip(text_list, predictions)]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO ner_cache (hash, entities) VALUES (?, ?)", rows)
@@ -1,29 +1,59 @@
 import torch
 import sys
+import numpy as np
 from transformers import AutoTokenizer, AutoModelForTokenClassification
-from typing import List, Dict, Union
+from typing import List, Dict, Union, Tuple
+from functools import lru_cache
 from tqdm import tqdm
+import os
+import tempfile
 
 try:
-    from config import NER_ID2LABEL, NER_LABEL2ID, DEVICE, MAX_LENGTH
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForTokenClassification
+except ImportError:
+    ort = None
+    ORTModelForTokenClassification = None
+
+try:
+    from config import NER_ID2LABEL, NER_LABEL2ID, DEVICE, MAX_LENGTH, NER_USE_ONNX_RUNTIME, NER_ONNX_DIR, QUANTIZE_NER
+    from backend.models_inference.ner_prediction_cache import NERPredictionCache
 except ImportError:
     print("NER_PREDICTOR: Ошибка импорта конфигурации. Убедитесь, что config.py доступен.")
     sys.exit(1)
 
+# Файл рядом с model.onnx с версией весов, из которых сделан экспорт
+_ONNX_STAMP_FILENAME = "weights.stamp"
+
+def _read_onnx_stamp(stamp_path: str) -> Union[str, None]:
+    """ Возвращает версию весов экспортированной модели ONNX или None, если ее нет. """
+    try:
+        with open(stamp_path, 'r', encoding='utf-8') as f_stamp:
+            return f_stamp.read()
+    except OSError:
+        return None
+
 class NERPredictor:
     """
     NER компонент пайплайна.
     """
-    def __init__(self, model_name_or_path: str, model_weights_path: str):
+    def __init__(self, model_name_or_path: str, model_weights_path: str, cache_path: Union[str, None] = None,
+                 cache_max_rows: Union[int, None] = None, verbose: bool = False):
         """
         Инициализирует NER компонент пайплайна.
 
         Args:
             model_name_or_path (str): Имя или путь к базовой модели.
             model_weights_path (str): Путь к файлу с дообученными весами модели.
+            cache_path (Union[str, None], optional): Путь к файлу дискового кэша предсказаний.
+                                                     Если None, кэш не используется.
+            cache_max_rows (Union[int, None], optional): Предельное число записей дискового кэша.
+                                                         Если None, размер не ограничивается.
+            verbose (bool, optional): Выводить ли статистику кэша при каждом вызове predict.
         """
         self.model_name_or_path = model_name_or_path
         self.model_weights_path = model_weights_path        
+        self.verbose = verbose
         self.id2label: Dict[int, str] = NER_ID2LABEL
         self.label2id: Dict[str, int] = NER_LABEL2ID
         self.num_labels: int = len(self.label2id) if self.label2id else 0        
@@ -31,8 +61,35 @@ class NERPredictor:
         self.max_length = MAX_LENGTH
         self.tokenizer: Union[AutoTokenizer, None] = None
         self.model: Union[AutoModelForTokenClassification, None] = None        
+        self.use_autocast: bool = self.device.type == "cuda"
+        self.autocast_dtype = torch.bfloat16 if self.use_autocast and torch.cuda.is_bf16_supported() else torch.float16
+        self.use_pinned_memory: bool = self.device.type == "cuda"
+        self.prediction_transfer_dtype = torch.uint8 if self.num_labels <= 256 else torch.int64
+        self.is_b_per, self.is_i_per = self._build_person_label_masks()
+        self.special_token_ids: np.ndarray = np.array([], dtype=np.int64)
+        self._span_to_text = lru_cache(maxsize=65536)(self._span_ids_to_text)
+        self.prediction_cache: Union[NERPredictionCache, None] = None
+        if cache_path:
+            try:
+                self.prediction_cache = NERPredictionCache(
+                    cache_path, namespace=self._prediction_cache_namespace(), max_rows=cache_max_rows)
+            except Exception as e_cache:
+                print(f"NERPredictor: Не удалось открыть кэш предсказаний, работа без кэша: {e_cache}")
         self._load_resources()
 
+    def _weights_stamp(self) -> str:
+        """
+        Версия модели: базовая модель, имя, время изменения и размер файла весов и MAX_LENGTH.
+        Меняется, если модель переобучена и сохранена под тем же именем или изменена длина усечения.
+        """
+        weights_stat = os.stat(self.model_weights_path)
+        return (f"{self.model_name_or_path}|{os.path.basename(self.model_weights_path)}|"
+                f"{weights_stat.st_mtime_ns}|{weights_stat.st_size}|{self.max_length}")
+
+    def _prediction_cache_namespace(self) -> str:
+        """ Пространство имен кэша предсказаний: предсказания других версий модели не читаются. """
+        return self._weights_stamp()
+
     def _load_resources(self):
         """
         Загружает токенизатор и модель NER.
@@ -41,72 +98,124 @@ class NERPredictor:
             print("NERPredictor: id2label или label2id не загружены из конфигурации.")
             return 
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path, use_fast=True)
+            if not self.tokenizer.is_fast:
+                print("NERPredictor WARNING: Быстрый (Rust) токенизатор недоступен, используется медленный.")
+            self.special_token_ids = np.array(
+                [tid for tid in (self.tokenizer.cls_token_id, self.tokenizer.sep_token_id, self.tokenizer.pad_token_id) if tid is not None],
+                dtype=np.int64)
             print("NERPredictor: Токенизатор загружен.")
         except Exception as e:
             print(f"NERPredictor: Ошибка загрузки токенизатора: {e}")
             raise 
+        if NER_USE_ONNX_RUNTIME:
+            if ORTModelForTokenClassification is None:
+                print("NERPredictor: optimum[onnxruntime] не установлен, используется модель PyTorch.")
+            else:
+                try:
+                    self.model = self._load_onnx_model()
+                    self.use_autocast = False
+                    print("NERPredictor: Модель ONNX Runtime загружена.")
+                    return
+                except Exception as e:
+                    print(f"NERPredictor: Ошибка загрузки модели ONNX Runtime, используется модель PyTorch: {e}")
         try:
-            self.model = AutoModelForTokenClassification.from_pretrained(
-                self.model_name_or_path,
-                num_labels=self.num_labels,
-                id2label=self.id2label,
-                label2id=self.label2id)
-            self.model.load_state_dict(torch.load(self.model_weights_path, map_location=self.device))
+            self.model = self._load_torch_model(self.device)
+            if QUANTIZE_NER and self.device.type == "cpu":
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+                print("NERPredictor: Модель квантована в INT8 для инференса на CPU.")
             self.model.to(self.device)
             self.model.eval()
+            if self.use_autocast:
+                torch.backends.cudnn.benchmark = True
             print("NERPredictor: Модель загружена и переведена в режим инференса.")
         except Exception as e:
             print(f"NERPredictor: Ошибка загрузки модели: {e}")
             raise 
+
+    def _load_torch_model(self, map_location: torch.device) -> AutoModelForTokenClassification:
+        """
+        Создает модель PyTorch и загружает в нее дообученные веса.
+        """
+        model = AutoModelForTokenClassification.from_pretrained(
+            self.model_name_or_path,
+            num_labels=self.num_labels,
+            id2label=self.id2label,
+            label2id=self.label2id)
+        model.load_state_dict(torch.load(self.model_weights_path, map_location=map_location))
+        return model
+
+    def _load_onnx_model(self) -> "ORTModelForTokenClassification":
+        """
+        Загружает модель NER в ONNX Runtime с полным набором графовых оптимизаций.
+        При первом запуске дообученная модель экспортируется в ONNX и сохраняется
+        в NER_ONNX_DIR вместе с версией весов; последующие запуски используют готовый файл,
+        пока версия весов не изменится.
+        """
+        stamp_path = os.path.join(NER_ONNX_DIR, _ONNX_STAMP_FILENAME)
+        weights_stamp = self._weights_stamp()
+        if not os.path.exists(os.path.join(NER_ONNX_DIR, "model.onnx")) or _read_onnx_stamp(stamp_path) != weights_stamp:
+            print(f"NERPredictor: Экспорт модели в ONNX: {NER_ONNX_DIR}")
+            torch_model = self._load_torch_model(torch.device("cpu"))
+            with tempfile.TemporaryDirectory() as export_source_dir:
+                torch_model.save_pretrained(export_source_dir)
+                ORTModelForTokenClassification.from_pretrained(export_source_dir, export=True).save_pretrained(NER_ONNX_DIR)
+            del torch_model
+            with open(stamp_path, 'w', encoding='utf-8') as f_stamp:
+                f_stamp.write(weights_stamp)
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        provider = "CUDAExecutionProvider" if self.device.type == "cuda" else "CPUExecutionProvider"
+        return ORTModelForTokenClassification.from_pretrained(NER_ONNX_DIR, provider=provider, session_options=session_options)
         
-    def _extract_entities_from_bio_tags(self, token_list: List[str], label_list: List[str]) -> List[Dict[str, Union[str, None]]]:
+    def _build_person_label_masks(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Строит булевы маски по идентификаторам меток для тегов B-PER и I-PER.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Маски (is_b_per, is_i_per), индексируемые id метки.
+        """
+        size = max(self.id2label.keys(), default=-1) + 1
+        is_b_per = np.zeros(size, dtype=bool)
+        is_i_per = np.zeros(size, dtype=bool)
+        for label_id, label_str in self.id2label.items():
+            is_b_per[label_id] = label_str == "B-PER"
+            is_i_per[label_id] = label_str == "I-PER"
+        return is_b_per, is_i_per
+
+    def _extract_person_entities(self, token_ids: np.ndarray, label_ids: np.ndarray) -> List[Dict[str, str]]:
         """
-        Извлекает сущности из последовательности токенов и их BIO-меток.
+        Извлекает персоны из последовательности токенов по их BIO-меткам.
+        Сущность начинается с B-PER и продолжается непрерывной серией I-PER;
+        I-PER без предшествующего B-PER игнорируется.
         
         Args:
-            token_list (List[str]): Список токенов.
-            label_list (List[str]): Список BIO-меток, соответствующий токенам.
+            token_ids (np.ndarray): Идентификаторы значимых токенов текста.
+            label_ids (np.ndarray): Идентификаторы предсказанных меток, соответствующие токенам.
 
         Returns:
-            List[Dict[str, Union[str, None]]]: Список словарей, где каждый словарь
-                                                представляет извлеченную сущность.
-                                                Формат: {"text": "текст сущности", "type": "тип сущности"}
+            List[Dict[str, str]]: Список словарей вида {"text": "имя персоны", "type": "PER"}.
         """
+        starts = np.flatnonzero(self.is_b_per[label_ids])
+        if starts.size == 0:
+            return []
+        breaks = np.append(np.flatnonzero(~self.is_i_per[label_ids]), label_ids.size)
+        ends = breaks[np.searchsorted(breaks, starts, side='right')]
         entities = []
-        current_entity_tokens = []
-        current_entity_type = None
-        for token, label_str in zip(token_list, label_list):
-            if label_str.startswith("B-"):
-                if current_entity_tokens:
-                    entities.append({
-                        "text": self.tokenizer.convert_tokens_to_string(current_entity_tokens).strip(),
-                        "type": current_entity_type})
-                current_entity_tokens = [token]
-                current_entity_type = label_str.split('-')[1]
-            elif label_str.startswith("I-"):
-                tag_type = label_str.split('-')[1]
-                if current_entity_tokens and tag_type == current_entity_type:
-                    current_entity_tokens.append(token)
-                else:
-                    if current_entity_tokens:
-                        entities.append({
-                            "text": self.tokenizer.convert_tokens_to_string(current_entity_tokens).strip(),
-                            "type": current_entity_type})
-                    current_entity_tokens = []
-                    current_entity_type = None
-            else: 
-                if current_entity_tokens:
-                    entities.append({
-                        "text": self.tokenizer.convert_tokens_to_string(current_entity_tokens).strip(),
-                        "type": current_entity_type})
-                current_entity_tokens = []
-                current_entity_type = None        
-        if current_entity_tokens:
+        for start, end in zip(starts.tolist(), ends.tolist()):
             entities.append({
-                "text": self.tokenizer.convert_tokens_to_string(current_entity_tokens).strip(),
-                "type": current_entity_type})
+                "text": self._span_to_text(tuple(token_ids[start:end].tolist())),
+                "type": "PER"})
         return entities
+
+    def _span_ids_to_text(self, span_token_ids: Tuple[int, ...]) -> str:
+        """
+        Собирает текст сущности из идентификаторов ее токенов.
+        Вызывается через мемоизирующую обертку self._span_to_text,
+        так как одни и те же персоны часто упоминаются в разных текстах.
+        """
+        span_tokens = self.tokenizer.convert_ids_to_tokens(list(span_token_ids))
+        return self.tokenizer.convert_tokens_to_string(span_tokens).strip()
     
     def predict(self, text_list: List[str], batch_size_inference: int = 16) -> List[List[Dict[str, str]]]:
         """
@@ -125,34 +234,76 @@ class NERPredictor:
         if not self.model or not self.tokenizer or not self.id2label:
             print("NERPredictor: Модель, токенизатор или карта меток не загружены. Предсказание невозможно.")
             return [[] for _ in text_list]
-        all_results_from_all_batches = []        
-        for i in tqdm(range(0, len(text_list), batch_size_inference), desc="NER Batch Inference (Predictor)"):
-            batch_texts = text_list[i:i + batch_size_inference]            
-            encodings = self.tokenizer(
-                batch_texts,
-                max_length=self.max_length,
+        if self.prediction_cache is None:
+            return self._predict_uncached(text_list, batch_size_inference)
+        try:
+            results = self.prediction_cache.get_many(text_list)
+        except Exception as e_cache:
+            print(f"NERPredictor: Ошибка чтения кэша предсказаний: {e_cache}")
+            results = [None] * len(text_list)
+        miss_indices = [idx for idx, cached in enumerate(results) if cached is None]
+        if self.verbose:
+            print(f"NERPredictor: Найдено в кэше {len(text_list) - len(miss_indices)} из {len(text_list)} текстов.")
+        if miss_indices:
+            miss_texts = [text_list[idx] for idx in miss_indices]
+            miss_results = self._predict_uncached(miss_texts, batch_size_inference)
+            for idx, entities in zip(miss_indices, miss_results):
+                results[idx] = entities
+            try:
+                self.prediction_cache.put_many(miss_texts, miss_results)
+            except Exception as e_cache:
+                print(f"NERPredictor: Ошибка записи в кэш предсказаний: {e_cache}")
+        return results
+
+    @torch.inference_mode()
+    def _predict_uncached(self, text_list: List[str], batch_size_inference: int) -> List[List[Dict[str, str]]]:
+        """
+        Выполняет инференс модели NER для списка текстов без обращения к кэшу.
+
+        Args:
+            text_list (List[str]): Список текстов для обработки.
+            batch_size_inference (int): Размер батча для инференса.
+
+        Returns:
+            List[List[Dict[str, str]]]: Найденные персоны для каждого текста.
+        """
+        all_results_from_all_batches: List[List[Dict[str, str]]] = [[] for _ in text_list]
+        if not text_list:
+            return all_results_from_all_batches
+        all_encodings = self.tokenizer(
+            text_list,
+            max_length=self.max_length,
+            truncation=True,
+            padding=False)
+        all_input_ids = all_encodings['input_ids']
+        all_attention_masks = all_encodings['attention_mask']
+        sorted_indices = sorted(range(len(text_list)), key=lambda idx: len(all_input_ids[idx]))
+        for i in tqdm(range(0, len(sorted_indices), batch_size_inference), desc="NER Batch Inference (Predictor)"):
+            batch_indices = sorted_indices[i:i + batch_size_inference]
+            encodings = self.tokenizer.pad(
+                {'input_ids': [all_input_ids[idx] for idx in batch_indices],
+                 'attention_mask': [all_attention_masks[idx] for idx in batch_indices]},
                 padding=True,
-                truncation=True,
-                return_tensors='pt')            
-            input_ids_batch = encodings['input_ids'].to(self.device)
-            attention_mask_batch = encodings['attention_mask'].to(self.device)
-            with torch.no_grad():
+                return_tensors='pt')
+            input_ids_cpu = encodings['input_ids']
+            attention_mask_cpu = encodings['attention_mask']
+            if self.use_pinned_memory:
+                input_ids_cpu = input_ids_cpu.pin_memory()
+                attention_mask_cpu = attention_mask_cpu.pin_memory()
+            input_ids_batch = input_ids_cpu.to(self.device, non_blocking=self.use_pinned_memory)
+            attention_mask_batch = attention_mask_cpu.to(self.device, non_blocking=self.use_pinned_memory)
+            with torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype, enabled=self.use_autocast):
                 outputs = self.model(input_ids=input_ids_batch, attention_mask=attention_mask_batch)
                 logits_batch = outputs.logits
-                predictions_batch_ids = torch.argmax(logits_batch, dim=-1)
-            for j in range(predictions_batch_ids.shape[0]):
-                pred_ids_single = predictions_batch_ids[j].cpu().numpy()
-                input_ids_single = input_ids_batch[j].cpu().numpy()
-                attention_mask_single = attention_mask_batch[j].cpu().numpy()                
-                actual_tokens_single = []
-                predicted_token_labels_single = []
-                raw_tokens_single = self.tokenizer.convert_ids_to_tokens(input_ids_single)
-                for k in range(len(input_ids_single)):
-                    if attention_mask_single[k] == 1:
-                        if raw_tokens_single[k] not in [self.tokenizer.cls_token, self.tokenizer.sep_token, self.tokenizer.pad_token]:
-                            actual_tokens_single.append(raw_tokens_single[k])
-                            predicted_token_labels_single.append(self.id2label.get(pred_ids_single[k], 'O'))                
-                entities_in_text = self._extract_entities_from_bio_tags(actual_tokens_single, predicted_token_labels_single)
-                person_entities = [entity for entity in entities_in_text if entity.get("type") == "PER"]
-                all_results_from_all_batches.append(person_entities)                
+                predictions_batch_ids = torch.argmax(logits_batch, dim=-1).to(self.prediction_transfer_dtype)
+            predictions_batch_np = predictions_batch_ids.cpu().numpy()
+            padded_length = predictions_batch_np.shape[1]
+            pad_on_left = self.tokenizer.padding_side == "left"
+            for j, original_idx in enumerate(batch_indices):
+                input_ids_single = np.asarray(all_input_ids[original_idx], dtype=np.int64)
+                length = input_ids_single.size
+                label_ids_single = predictions_batch_np[j, padded_length - length:] if pad_on_left else predictions_batch_np[j, :length]
+                valid_positions = ~np.isin(input_ids_single, self.special_token_ids)
+                all_results_from_all_batches[original_idx] = self._extract_person_entities(
+                    input_ids_single[valid_positions], label_ids_single[valid_positions])
         return all_results_from_all_batches
\ No newline at end of file
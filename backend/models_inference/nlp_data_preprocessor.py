@@ -1,6 +1,12 @@
 import json
 import os
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Iterator
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 class NLPDataPreprocessor:
     """
@@ -69,6 +75,35 @@ class NLPDataPreprocessor:
             "original_text_preview": comment_text[:self.max_text_preview_length]}
         return comment_text, metadata
 
+    def _iter_records(self, parsed_data_path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Построчно читает JSONL файл в бинарном режиме и лениво выдает
+        пары (текст, метаданные) для постов и комментариев.
+
+        Args:
+            parsed_data_path (str): Путь к файлу .jsonl с результатами парсинга VK.
+
+        Yields:
+            Tuple[str, Dict[str, Any]]: Пара (текст, метаданные) для каждого непустого текста.
+        """
+        with open(parsed_data_path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                record = None
+                try:
+                    record = _json_loads(line)
+                    post_text, post_meta = self._extract_post_data(record)
+                    if post_text:
+                        yield post_text, post_meta
+                    for comment in record.get("comments", []):
+                        comment_text, comment_meta = self._extract_comment_data(comment, record)
+                        if comment_text:
+                            yield comment_text, comment_meta
+                except json.JSONDecodeError:
+                    print(f"NLPDataPreprocessor: Ошибка декодирования JSON в строке {line_number} файла {parsed_data_path}")
+                except Exception as e_rec: 
+                    post_id_for_log = record.get('vk_post_id', 'N/A') if isinstance(record, dict) else 'N/A'
+                    print(f"NLPDataPreprocessor: Ошибка обработки записи (вероятно, post_id: {post_id_for_log}) в строке {line_number}: {e_rec}")
+
     def extract_and_prepare_input(self, parsed_data_path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
         """
         Читает загруженные данные из JSONL файла, извлекает тексты для NLP анализа
@@ -89,26 +124,11 @@ class NLPDataPreprocessor:
             print(f"NLPDataPreprocessor: Файл с спарсенными данными не найден: {parsed_data_path}")
             return texts_for_nlp, metadata_for_nlp            
         try:
-            with open(parsed_data_path, 'r', encoding='utf-8') as f:
-                for line_number, line in enumerate(f, 1):
-                    try:
-                        record = json.loads(line)                        
-                        post_text, post_meta = self._extract_post_data(record)
-                        if post_text:
-                            texts_for_nlp.append(post_text)
-                            metadata_for_nlp.append(post_meta)                        
-                        for comment in record.get("comments", []):
-                            comment_text, comment_meta = self._extract_comment_data(comment, record)
-                            if comment_text:
-                                texts_for_nlp.append(comment_text)
-                                metadata_for_nlp.append(comment_meta)                                
-                    except json.JSONDecodeError:
-                        print(f"NLPDataPreprocessor: Ошибка декодирования JSON в строке {line_number} файла {parsed_data_path}")
-                    except Exception as e_rec: 
-                        post_id_for_log = record.get('vk_post_id', 'N/A') if isinstance(record, dict) else 'N/A'
-                        print(f"NLPDataPreprocessor: Ошибка обработки записи (вероятно, post_id: {post_id_for_log}) в строке {line_number}: {e_rec}")
+            for text, metadata in self._iter_records(parsed_data_path):
+                texts_for_nlp.append(text)
+                metadata_for_nlp.append(metadata)
             print(f"NLPDataPreprocessor: Подготовлено {len(texts_for_nlp)} текстов для NLP анализа.")
         except Exception as e_file:
             print(f"NLPDataPreprocessor: Ошибка чтения файла {parsed_data_path}: {e_file}")
             raise RuntimeError(f"Не удалось прочитать файл {parsed_data_path}") from e_file            
-        return texts_for_nlp, metadata_for_nlp
\ No newline at end of file
+        return texts_for_nlp, metadata_for_nlp
@@ -0,0 +1,106 @@
+import asyncio
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Dict, Tuple
+
+try:
+    from backend.models_inference.pipeline_runner import SentimentPipeline
+except ImportError as e:
+    print(f"PIPELINE_BATCHER: Ошибка импорта: {e}")
+    sys.exit(1)
+
+class PipelineBatcher:
+    """
+    Динамический батчинг запросов к SentimentPipeline.
+    Фоновый поток собирает тексты из одновременно выполняющихся анализов
+    в один общий вызов пайплайна и раздает результаты вызывающим сторонам.
+    """
+    def __init__(self, pipeline: SentimentPipeline, max_batch_texts: int, max_latency_ms: float):
+        """
+        Инициализирует батчер и запускает фоновый поток обработки.
+
+        Args:
+            pipeline (SentimentPipeline): Экземпляр пайплайна анализа тональности.
+            max_batch_texts (int): Количество текстов, после набора которого батч
+                                   отправляется в пайплайн без ожидания.
+            max_latency_ms (float): Максимальное время ожидания (мс) других запросов
+                                    после поступления первого запроса в батч.
+        """
+        self.pipeline = pipeline
+        self.max_batch_texts = max_batch_texts
+        self.max_latency_s = max_latency_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._serve_forever, name="PipelineBatcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text_list: List[str]) -> Future:
+        """
+        Ставит список текстов в очередь на анализ.
+
+        Args:
+            text_list (List[str]): Список текстов для анализа.
+
+        Returns:
+            Future: Future, который получит результат SentimentPipeline.run для этих текстов.
+        """
+        future: Future = Future()
+        self._queue.put((text_list, future))
+        return future
+
+    async def run(self, text_list: List[str]) -> List[List[Dict[str, str]]]:
+        """
+        Асинхронно выполняет анализ списка текстов через общий батч.
+
+        Args:
+            text_list (List[str]): Список текстов для анализа.
+
+        Returns:
+            List[List[Dict[str, str]]]: Результаты в формате SentimentPipeline.run.
+        """
+        return await asyncio.wrap_future(self.submit(text_list))
+
+    def _collect_batch(self) -> List[Tuple[List[str], Future]]:
+        """
+        Блокируется до первого запроса, затем добирает запросы в батч,
+        пока не будет набрано max_batch_texts текстов или не истечет max_latency.
+        """
+        batch = [self._queue.get()]
+        total_texts = len(batch[0][0])
+        deadline = time.monotonic() + self.max_latency_s
+        while total_texts < self.max_batch_texts:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            total_texts += len(item[0])
+        return [(texts, future) for texts, future in batch if future.set_running_or_notify_cancel()]
+
+    def _serve_forever(self):
+        """
+        Основной цикл фонового потока.
+        """
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            combined_texts = [text for texts, _ in batch for text in texts]
+            if len(batch) > 1:
+                print(f"PipelineBatcher: Объединено {len(batch)} запросов ({len(combined_texts)} текстов) в один батч.")
+            try:
+                combined_results = self.pipeline.run(combined_texts)
+            except Exception as e_batch:
+                print(f"PipelineBatcher: Ошибка выполнения пайплайна: {e_batch}")
+                for _, future in batch:
+                    future.set_exception(e_batch)
+                continue
+            offset = 0
+            for texts, future in batch:
+                future.set_result(combined_results[offset:offset + len(texts)])
+                offset += len(texts)
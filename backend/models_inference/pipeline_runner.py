@@ -1,6 +1,10 @@
+import queue
+import re
 import sys
-from typing import List, Dict, Tuple, Any 
-from natasha import Doc, Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Iterable, Union
 
 try:
     import config 
@@ -11,12 +15,33 @@ except ImportError as e:
     print(f"PIPELINE_RUNNER: Ошибка импорта: {e}")
     sys.exit(1)
 
+try:
+    import pymorphy3 as pymorphy
+except ImportError:
+    try:
+        import pymorphy2 as pymorphy
+    except ImportError:
+        pymorphy = None
+
+# Граммемы pymorphy для имен, фамилий и отчеств: при нескольких разборах слова предпочитается разбор как имени
+_NAME_GRAMMEMES = frozenset({"Name", "Surn", "Patr"})
+_INITIAL_RE = re.compile(r"[^\W\d_]\.?")
+_NAME_TOKEN_RE = re.compile(r"[^\W\d_]\.|[^\W_]+(?:-[^\W_]+)*|\S")
+
+def _tokenize_name(name_phrase: str) -> List[str]:
+    """
+    Разбивает имя персоны на токены: инициалы с точкой ("А."), слова
+    (в том числе через дефис) и отдельные знаки препинания.
+    """
+    return _NAME_TOKEN_RE.findall(name_phrase)
+
 class SentimentPipeline:
     """
     Полный процесс анализа тональности.
     """
     def __init__(self, ner_predictor: NERPredictor, tesa_predictor: TESAPredictor, 
-                 ner_batch_size: int, tesa_batch_size: int):
+                 ner_batch_size: int, tesa_batch_size: int, verbose: bool = False,
+                 chunk_size: int = 512):
         """
         Инициализирует пайплайн анализа тональности.
 
@@ -25,21 +50,61 @@ class SentimentPipeline:
             tesa_predictor (TESAPredictor): Экземпляр предиктора TESA.
             ner_batch_size (int): Размер батча для NER инференса.
             tesa_batch_size (int): Размер батча для TESA инференса.
+            verbose (bool, optional): Выводить ли подробные сообщения о ходе каждого запуска.
+                                      Сообщения об ошибках выводятся всегда.
+            chunk_size (int, optional): Количество текстов в одной порции конвейера
+                                        NER -> TESA / нормализация имен.
         """
         self.ner_predictor = ner_predictor
         self.tesa_predictor = tesa_predictor
         self.ner_batch_size = ner_batch_size
         self.tesa_batch_size = tesa_batch_size
-        
-        try:
-            self.segmenter = Segmenter()
-            self.morph_vocab = MorphVocab()
-            emb = NewsEmbedding() 
-            self.morph_tagger = NewsMorphTagger(emb) 
-            self.lemmatization_enabled = True
-        except Exception as e_natasha:
-            print(f"SentimentPipeline: Не удалось инициализировать компоненты Natasha: {e_natasha}")
-            raise RuntimeError("Ошибка инициализации морфологического анализатора") from e_natasha
+        self.verbose = verbose
+        self.chunk_size = max(1, chunk_size)
+        self._lemma_cache: Dict[str, str] = {}
+        self.morph = None
+        if pymorphy is None:
+            print("SentimentPipeline WARNING: pymorphy3 не установлен, падежные формы имен не объединяются "
+                  "(\"Путина\" и \"Путин\" считаются разными персонами).")
+        else:
+            try:
+                self.morph = pymorphy.MorphAnalyzer()
+            except Exception as e_morph:
+                print(f"SentimentPipeline WARNING: Не удалось инициализировать морфологический анализатор, "
+                      f"падежные формы имен не объединяются: {e_morph}")
+
+    _LEMMA_CACHE_MAX_SIZE = 8192
+
+    def _normalize_name_tokens(self, tokens: List[str]) -> str:
+        """
+        Собирает нормализованное имя из токенов: инициалы приводятся
+        к верхнему регистру, слова - к начальной форме вида "Слово".
+        """
+        normalized_words = []
+        for text in tokens:        
+            if _INITIAL_RE.fullmatch(text) and (len(text) == 2 or text.isupper()):
+                normalized_words.append(text.upper())
+            elif text[0].isalpha():
+                normalized_words.append(self._lemmatize_word(text))
+            else:
+                normalized_words.append(text.capitalize())
+                
+        return " ".join(normalized_words)
+
+    def _lemmatize_word(self, word: str) -> str:
+        """
+        Приводит слово имени к именительному падежу с сохранением рода
+        ("Путину" -> "Путин", "Ивановой" -> "Иванова") и к виду "Слово" (части через дефис - каждая).
+        Без морфологического анализатора слово только приводится к этому регистру.
+        """
+        lemma = word
+        if self.morph is not None:
+            parses = self.morph.parse(word)
+            if parses:
+                best_parse = next((parse for parse in parses if _NAME_GRAMMEMES & parse.tag.grammemes), parses[0])
+                nominative = best_parse.inflect({"nomn"})
+                lemma = nominative.word if nominative is not None else best_parse.normal_form
+        return "-".join(part.capitalize() for part in lemma.split("-"))
 
     def _lemmatize_name(self, name_phrase: str) -> str:
         """
@@ -49,31 +114,77 @@ class SentimentPipeline:
         """
         if not name_phrase or not name_phrase.strip():
             return ""
-        
-        doc = Doc(name_phrase)
-        doc.segment(self.segmenter)
-        doc.tag_morph(self.morph_tagger)
+        return self._lemmatize_names([name_phrase])[name_phrase]
 
-        normalized_words = []
-        for token in doc.tokens:        
-            is_initial = (len(token.text) == 2 and token.text[1] == '.' and token.text[0].isalpha()) or \
-                         (len(token.text) == 1 and token.text[0].isupper() and token.text.isalpha()) 
-
-            if is_initial:
-                if len(token.text) == 2 and token.text[1] == '.':
-                    normalized_words.append(token.text[0].upper() + ".")
-                else: 
-                    normalized_words.append(token.text.upper())
-            elif token.lemma:
-                normalized_words.append(token.lemma.capitalize())
+    def _lemmatize_names(self, name_phrases: Iterable[str]) -> Dict[str, str]:
+        """
+        Нормализует набор имен.
+        Имена, состоящие только из слов с заглавной буквы, лемматизируются пословно,
+        остальные предварительно разбиваются на токены регулярным выражением.
+
+        Args:
+            name_phrases (Iterable[str]): Имена для нормализации.
+
+        Returns:
+            Dict[str, str]: Словарь {исходное_имя: нормализованное_имя}. Для пустых
+                            строк и строк из пробелов значение - пустая строка.
+        """
+        normalized: Dict[str, str] = {}
+        for name_phrase in dict.fromkeys(name_phrases):
+            if not name_phrase or not name_phrase.strip():
+                normalized[name_phrase] = ""
+                continue
+            words = name_phrase.split()
+            if all(len(word) > 2 and word[0].isupper() and word.isalpha() for word in words):
+                normalized[name_phrase] = " ".join(self._lemmatize_word(word) for word in words)
             else:
-                normalized_words.append(token.text.capitalize())
-                
-        return " ".join(normalized_words)
+                normalized[name_phrase] = self._normalize_name_tokens(_tokenize_name(name_phrase))
+        return normalized
+
+    def _lemmatize_with_cache(self, name_phrases: Iterable[str]) -> Dict[str, str]:
+        """
+        Возвращает нормализованные имена, вычисляя заново только те,
+        которых нет в кэше экземпляра.
+        """
+        unique_phrases = set(name_phrases)
+        missing = [name_phrase for name_phrase in unique_phrases if name_phrase not in self._lemma_cache]
+        if missing:
+            if len(self._lemma_cache) + len(missing) > self._LEMMA_CACHE_MAX_SIZE:
+                self._lemma_cache.clear()
+            self._lemma_cache.update(self._lemmatize_names(missing))
+        return {name_phrase: self._lemma_cache[name_phrase] for name_phrase in unique_phrases}
     
+    def _predict_polarities(self, tesa_input_pairs: List[Tuple[str, str]]) -> List[str]:
+        """
+        Определяет тональность для пар (текст, сущность), отправляя в TESA
+        каждую уникальную пару один раз.
+
+        Args:
+            tesa_input_pairs (List[Tuple[str, str]]): Пары для анализа.
+
+        Returns:
+            List[str]: Метка тональности для каждой входной пары.
+        """
+        unique_pair_positions: Dict[Tuple[str, str], int] = {}
+        pair_idx_for_map = [unique_pair_positions.setdefault(pair, len(unique_pair_positions)) for pair in tesa_input_pairs]
+        unique_tesa_input_pairs = list(unique_pair_positions)
+        if self.verbose:
+            print(f"SentimentPipeline: TESA: {len(tesa_input_pairs)} пар (уникальных {len(unique_tesa_input_pairs)}), batch_size={self.tesa_batch_size}")
+        try:
+            unique_polarities = self.tesa_predictor.predict(unique_tesa_input_pairs, batch_size_inference=self.tesa_batch_size)
+        except Exception as e_tesa:
+            print(f"SentimentPipeline: Ошибка на этапе TESA: {e_tesa}")
+            return ["ERROR_TESA_PIPELINE"] * len(tesa_input_pairs)
+        if len(unique_polarities) != len(unique_tesa_input_pairs):
+            print("SentimentPipeline: Несовпадение длин результатов TESA и словаря сущностей.")
+            return ["ERROR_TESA_LENGTH_MISMATCH"] * len(tesa_input_pairs)
+        return [unique_polarities[pair_idx] for pair_idx in pair_idx_for_map]
+
     def run(self, text_list: List[str]) -> List[List[Dict[str, str]]]:
         """
         Запускает полный анализ тональности для списка текстов.
+        Тексты обрабатываются порциями по chunk_size: пока NER размечает следующую
+        порцию, TESA и нормализация имен обрабатывают предыдущие в фоновых потоках.
 
         Args:
             text_list (List[str]): Список текстов для анализа.
@@ -85,59 +196,78 @@ class SentimentPipeline:
                                          Формат словаря: {"entity": "нормализованное_имя_персоны", "entity_original": "оригинальное_имя_персоны_из_текста", "polarity": "метка_тональности"}
         """
         if not text_list:
-            print("SentimentPipeline: Возвращен пустой результат.")
+            if self.verbose:
+                print("SentimentPipeline: Возвращен пустой результат.")
             return []        
-        print(f"SentimentPipeline: Вызов NERPredictor.predict с batch_size={self.ner_batch_size}")
-        try:
-            all_ner_results_per_text = self.ner_predictor.predict(text_list, batch_size_inference=self.ner_batch_size)
-        except Exception as e_ner:
-            print(f"SentimentPipeline: Ошибка на этапе NER: {e_ner}")
-            return [[] for _ in text_list]         
-        print(f"SentimentPipeline: NER этап завершен. Получено результатов для {len(all_ner_results_per_text)} текстов.")
-        all_tesa_input_pairs: List[Tuple[str, str]] = []
-        tesa_input_map_back: List[Dict[str, Any]] = []
-        for text_idx, (original_text, ner_entities_for_text) in enumerate(zip(text_list, all_ner_results_per_text)):
-            if ner_entities_for_text: 
-                for entity_info in ner_entities_for_text:
-                    entity_text = entity_info.get("text")
-                    if entity_text and isinstance(entity_text, str):
-                        all_tesa_input_pairs.append((original_text, entity_text))
-                        tesa_input_map_back.append({"text_idx": text_idx, "entity_text": entity_text})
-        
-        final_pipeline_results: List[List[Dict[str, str]]] = [[] for _ in text_list]
-        if all_tesa_input_pairs:
-            print(f"SentimentPipeline: TESA: Подготовлено {len(all_tesa_input_pairs)} пар (текст, сущность) для анализа тональности.")
-            print(f"SentimentPipeline: Вызов TESAPredictor.predict с batch_size={self.tesa_batch_size}")
+        pair_text_indices: List[int] = []
+        pair_entity_texts: List[str] = []
+        polarity_chunks: List[List[str]] = []
+        tesa_queue: "queue.Queue[Union[List[Tuple[str, str]], None]]" = queue.Queue(maxsize=2)
+
+        def tesa_consumer():
+            while True:
+                chunk_pairs = tesa_queue.get()
+                if chunk_pairs is None:
+                    return
+                try:
+                    polarity_chunks.append(self._predict_polarities(chunk_pairs))
+                except Exception as e_tesa:
+                    print(f"SentimentPipeline: Ошибка на этапе TESA: {e_tesa}")
+                    polarity_chunks.append(["ERROR_TESA_PIPELINE"] * len(chunk_pairs))
+
+        tesa_thread = threading.Thread(target=tesa_consumer, name="SentimentPipelineTESA", daemon=True)
+        tesa_thread.start()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="SentimentPipelineLemma") as lemma_executor:
+            lemma_futures = []
             try:
-                predicted_polarities = self.tesa_predictor.predict(all_tesa_input_pairs, batch_size_inference=self.tesa_batch_size)
-            except Exception as e_tesa:
-                print(f"SentimentPipeline: Ошибка на этапе TESA: {e_tesa}")
-                predicted_polarities = ["ERROR_TESA_PIPELINE"] * len(all_tesa_input_pairs)
-            if len(predicted_polarities) == len(tesa_input_map_back):
-                for i, map_info in enumerate(tesa_input_map_back):
-                    original_text_index = map_info["text_idx"]
-                    entity_text = map_info["entity_text"]
-                    polarity = predicted_polarities[i]
-                    normalized_entity_text = self._lemmatize_name(entity_text)
-                    
-                    if not normalized_entity_text:
-                        normalized_entity_text = entity_text.capitalize() 
-
-                    final_pipeline_results[original_text_index].append({
-                        "entity": normalized_entity_text,        
-                        "entity_original": entity_text,      
-                        "polarity": polarity
-                    })                    
-            else:
-                print("SentimentPipeline: Несовпадение длин результатов TESA и словаря сущностей.")
-                for map_info in tesa_input_map_back:
-                    original_text_index = map_info["text_idx"]
-                    entity_text = map_info["entity_text"]
-                    final_pipeline_results[original_text_index].append({
-                        "entity": entity_text,
-                        "polarity": "ERROR_TESA_LENGTH_MISMATCH"})
-        else:
-            print("SentimentPipeline: TESA: Нет сущностей, извлеченных NER, для анализа тональности.")        
+                for chunk_start in range(0, len(text_list), self.chunk_size):
+                    chunk_texts = text_list[chunk_start:chunk_start + self.chunk_size]
+                    if self.verbose:
+                        print(f"SentimentPipeline: NER для текстов {chunk_start}-{chunk_start + len(chunk_texts)} из {len(text_list)}, batch_size={self.ner_batch_size}")
+                    try:
+                        ner_results_for_chunk = self.ner_predictor.predict(chunk_texts, batch_size_inference=self.ner_batch_size)
+                    except Exception as e_ner:
+                        print(f"SentimentPipeline: Ошибка на этапе NER: {e_ner}")
+                        continue
+                    chunk_pairs: List[Tuple[str, str]] = []
+                    for text_idx, (original_text, ner_entities_for_text) in enumerate(zip(chunk_texts, ner_results_for_chunk), start=chunk_start):
+                        if ner_entities_for_text: 
+                            for entity_info in ner_entities_for_text:
+                                entity_text = entity_info.get("text")
+                                if entity_text and isinstance(entity_text, str):
+                                    chunk_pairs.append((original_text, entity_text))
+                                    pair_text_indices.append(text_idx)
+                                    pair_entity_texts.append(entity_text)
+                    if chunk_pairs:
+                        tesa_queue.put(chunk_pairs)
+                        lemma_futures.append(lemma_executor.submit(
+                            self._lemmatize_with_cache, [entity_text for _, entity_text in chunk_pairs]))
+            finally:
+                tesa_queue.put(None)
+                tesa_thread.join()
+            normalized_by_entity: Dict[str, str] = {}
+            for lemma_future in lemma_futures:
+                normalized_by_entity.update(lemma_future.result())
+
+        if not pair_entity_texts:
+            if self.verbose:
+                print("SentimentPipeline: TESA: Нет сущностей, извлеченных NER, для анализа тональности.")
+            return [[] for _ in text_list]
+        predicted_polarities = [polarity for polarity_chunk in polarity_chunks for polarity in polarity_chunk]
+        flat_results = [
+            {"entity": normalized_by_entity[entity_text] or entity_text.capitalize(),
+             "entity_original": entity_text,
+             "polarity": polarity}
+            for entity_text, polarity in zip(pair_entity_texts, predicted_polarities)]
+
+        # Пары сформированы в порядке возрастания индекса текста, поэтому результаты
+        # каждого текста занимают непрерывный отрезок flat_results.
+        text_boundaries = np.cumsum(np.bincount(np.asarray(pair_text_indices, dtype=np.int64), minlength=len(text_list)))
+        final_pipeline_results: List[List[Dict[str, str]]] = []
+        start = 0
+        for end in text_boundaries.tolist():
+            final_pipeline_results.append(flat_results[start:end])
+            start = end
         return final_pipeline_results
 
 def create_sentiment_pipeline() -> SentimentPipeline:
@@ -147,10 +277,14 @@ def create_sentiment_pipeline() -> SentimentPipeline:
     try:
         ner_predictor_instance = NERPredictor(
             model_name_or_path=config.NER_MODEL_NAME_OR_PATH,
-            model_weights_path=config.NER_MODEL_WEIGHTS_PATH)
+            model_weights_path=config.NER_MODEL_WEIGHTS_PATH,
+            cache_path=config.NER_CACHE_PATH if config.NER_CACHE_ENABLED else None,
+            cache_max_rows=config.NER_CACHE_MAX_ROWS,
+            verbose=config.NLP_VERBOSE_LOGGING)
         tesa_predictor_instance = TESAPredictor(
             model_name_or_path=config.TESA_MODEL_NAME_OR_PATH,
-            model_weights_path=config.TESA_MODEL_WEIGHTS_PATH)
+            model_weights_path=config.TESA_MODEL_WEIGHTS_PATH,
+            show_progress=config.TESA_SHOW_PROGRESS)
     except Exception as e:
         print(f"PIPELINE_RUNNER: Ошибка при создании экземпляров предикторов: {e}")
         raise RuntimeError(f"Не удалось инициализировать предикторы: {e}") from e
@@ -158,6 +292,8 @@ def create_sentiment_pipeline() -> SentimentPipeline:
         ner_predictor=ner_predictor_instance,
         tesa_predictor=tesa_predictor_instance,
         ner_batch_size=config.NER_INFERENCE_BATCH_SIZE,
-        tesa_batch_size=config.TESA_INFERENCE_BATCH_SIZE)    
+        tesa_batch_size=config.TESA_INFERENCE_BATCH_SIZE,
+        verbose=config.NLP_VERBOSE_LOGGING,
+        chunk_size=config.NLP_PIPELINE_CHUNK_TEXTS)    
     print("PIPELINE_RUNNER: SentimentPipeline успешно создан и готов к работе.")
     return pipeline_instance
\ No newline at end of file
@@ -1,36 +1,66 @@
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 from typing import List, Tuple, Union, Dict
 from tqdm import tqdm
 import sys
+import os
+import tempfile
 
 try:
-    from config import TESA_ID2LABEL, TESA_LABEL2ID, DEVICE, MAX_LENGTH
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+except ImportError:
+    ort = None
+    ORTModelForSequenceClassification = None
+
+try:
+    from config import TESA_ID2LABEL, TESA_LABEL2ID, DEVICE, MAX_LENGTH, TESA_USE_ONNX_RUNTIME, TESA_ONNX_DIR, TESA_USE_TORCH_COMPILE, QUANTIZE_TESA
 except ImportError:
     print("TESA_PREDICTOR: Ошибка импорта конфигурации. Убедитесь, что config.py доступен.")
     sys.exit(1)
 
+# Файл рядом с model.onnx с версией весов, из которых сделан экспорт
+_ONNX_STAMP_FILENAME = "weights.stamp"
+
+def _read_onnx_stamp(stamp_path: str) -> Union[str, None]:
+    """ Возвращает версию весов экспортированной модели ONNX или None, если ее нет. """
+    try:
+        with open(stamp_path, 'r', encoding='utf-8') as f_stamp:
+            return f_stamp.read()
+    except OSError:
+        return None
+
 class TESAPredictor:
     """
     TESA компонент пайплайна.
     """
-    def __init__(self, model_name_or_path: str, model_weights_path: str):
+    def __init__(self, model_name_or_path: str, model_weights_path: str, show_progress: bool = False):
         """
         Инициализирует TESA компонент.
 
         Args:
             model_name_or_path (str): Имя или путь к базовой модели/архитектуре.
             model_weights_path (str): Путь к файлу с дообученными весами модели.
+            show_progress (bool, optional): Показывать ли прогресс-бар tqdm по батчам.
         """
         self.model_name_or_path = model_name_or_path
         self.model_weights_path = model_weights_path
         self.id2label: Dict[int, str] = TESA_ID2LABEL
         self.label2id: Dict[str, int] = TESA_LABEL2ID
         self.num_labels: int = len(self.label2id) if self.label2id else 0
+        self._id2label_tuple: Tuple[str, ...] = tuple(
+            self.id2label.get(label_id, "UNKNOWN_SENTIMENT_ID") for label_id in range(self.num_labels))
         self.device = DEVICE
         self.max_length = MAX_LENGTH        
+        self._show_progress = show_progress
         self.tokenizer: Union[AutoTokenizer, None] = None
         self.model: Union[AutoModelForSequenceClassification, None] = None        
+        self.use_autocast: bool = self.device.type == "cuda"
+        self.autocast_dtype = torch.bfloat16 if self.use_autocast and torch.cuda.is_bf16_supported() else torch.float16
+        self.use_pinned_memory: bool = self.device.type == "cuda"
+        self.mask_transfer_dtype = torch.int32
+        self._use_token_type_ids: bool = False
         self._load_resources()
 
     def _load_resources(self):
@@ -42,24 +72,126 @@ class TESAPredictor:
             print("ESAPredictor: id2label или label2id не загружены из конфигурации.")
             return        
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path, use_fast=True)
+            if not self.tokenizer.is_fast:
+                print("TESAPredictor WARNING: Быстрый (Rust) токенизатор недоступен, используется медленный.")
+            self._use_token_type_ids = "token_type_ids" in self.tokenizer.model_input_names
             print("TESAPredictor: Токенизатор загружен.")
         except Exception as e:
             print(f"TESAPredictor: Ошибка загрузки токенизатора: {e}")
             raise
+        if TESA_USE_ONNX_RUNTIME:
+            if ORTModelForSequenceClassification is None:
+                print("TESAPredictor: optimum[onnxruntime] не установлен, используется модель PyTorch.")
+            else:
+                try:
+                    self.model = self._load_onnx_model()
+                    self.use_autocast = False
+                    self.mask_transfer_dtype = torch.int64
+                    print("TESAPredictor: Модель ONNX Runtime загружена.")
+                    return
+                except Exception as e:
+                    print(f"TESAPredictor: Ошибка загрузки модели ONNX Runtime, используется модель PyTorch: {e}")
         try:
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                self.model_name_or_path,
-                num_labels=self.num_labels,
-                id2label=self.id2label,
-                label2id=self.label2id)
-            self.model.load_state_dict(torch.load(self.model_weights_path, map_location=self.device))
+            self.model = self._load_torch_model(self.device)
+            quantized = QUANTIZE_TESA and self.device.type == "cpu"
+            if quantized:
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+                print("TESAPredictor: Модель квантована в INT8 для инференса на CPU.")
             self.model.to(self.device)
             self.model.eval()
             print("TESAPredictor: Модель загружена и переведена в режим инференса.")
         except Exception as e:
             print(f"TESAPredictor: Ошибка загрузки модели: {e}")
             raise
+        if quantized and not TESA_USE_TORCH_COMPILE:
+            self._warmup()
+        if TESA_USE_TORCH_COMPILE:
+            if not hasattr(torch, "compile"):
+                print("TESAPredictor: torch.compile недоступен в этой версии PyTorch.")
+            else:
+                try:
+                    self.model = torch.compile(self.model, dynamic=True)
+                    self._warmup()
+                    print("TESAPredictor: Модель скомпилирована через torch.compile.")
+                except Exception as e:
+                    print(f"TESAPredictor: Ошибка torch.compile, используется исходная модель: {e}")
+                    self.model = getattr(self.model, "_orig_mod", self.model)
+
+    def _load_torch_model(self, map_location: torch.device) -> AutoModelForSequenceClassification:
+        """
+        Создает модель PyTorch и загружает в нее дообученные веса.
+        """
+        model = AutoModelForSequenceClassification.from_pretrained(
+            self.model_name_or_path,
+            num_labels=self.num_labels,
+            id2label=self.id2label,
+            label2id=self.label2id)
+        model.load_state_dict(torch.load(self.model_weights_path, map_location=map_location))
+        return model
+
+    def _weights_stamp(self) -> str:
+        """
+        Версия модели: базовая модель, имя, время изменения и размер файла весов и MAX_LENGTH.
+        Меняется, если модель переобучена и сохранена под тем же именем или изменена длина усечения.
+        """
+        weights_stat = os.stat(self.model_weights_path)
+        return (f"{self.model_name_or_path}|{os.path.basename(self.model_weights_path)}|"
+                f"{weights_stat.st_mtime_ns}|{weights_stat.st_size}|{self.max_length}")
+
+    def _load_onnx_model(self) -> "ORTModelForSequenceClassification":
+        """
+        Загружает модель TESA в ONNX Runtime с полным набором графовых оптимизаций.
+        При первом запуске дообученная модель экспортируется в ONNX и сохраняется
+        в TESA_ONNX_DIR вместе с версией весов; последующие запуски используют готовый файл,
+        пока версия весов не изменится.
+        """
+        stamp_path = os.path.join(TESA_ONNX_DIR, _ONNX_STAMP_FILENAME)
+        weights_stamp = self._weights_stamp()
+        if not os.path.exists(os.path.join(TESA_ONNX_DIR, "model.onnx")) or _read_onnx_stamp(stamp_path) != weights_stamp:
+            print(f"TESAPredictor: Экспорт модели в ONNX: {TESA_ONNX_DIR}")
+            torch_model = self._load_torch_model(torch.device("cpu"))
+            with tempfile.TemporaryDirectory() as export_source_dir:
+                torch_model.save_pretrained(export_source_dir)
+                ORTModelForSequenceClassification.from_pretrained(export_source_dir, export=True).save_pretrained(TESA_ONNX_DIR)
+            del torch_model
+            with open(stamp_path, 'w', encoding='utf-8') as f_stamp:
+                f_stamp.write(weights_stamp)
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        provider = "CUDAExecutionProvider" if self.device.type == "cuda" else "CPUExecutionProvider"
+        return ORTModelForSequenceClassification.from_pretrained(TESA_ONNX_DIR, provider=provider, session_options=session_options)
+
+    @torch.inference_mode()
+    def _warmup(self):
+        """
+        Прогоняет через модель тестовую пару, чтобы компиляция произошла
+        при загрузке, а не на первом реальном запросе.
+        """
+        encodings = self.tokenizer(["Тестовый текст."], ["Тест"], return_token_type_ids=self._use_token_type_ids, return_tensors='pt')
+        model_inputs = {key: tensor.to(self.device) for key, tensor in encodings.items()}
+        with torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype, enabled=self.use_autocast):
+            self.model(**model_inputs)
+
+    def _prepare_batch(self, all_encodings, batch_positions: List[int]) -> Dict[str, torch.Tensor]:
+        """
+        Дополняет паддингом токенизированные пары батча и собирает тензоры на CPU.
+        Маски внимания и token_type_ids приводятся к mask_transfer_dtype (input_ids
+        остаются int64 для слоя эмбеддингов). При инференсе на GPU тензоры
+        размещаются в закрепленной (pinned) памяти.
+        """
+        encodings = self.tokenizer.pad(
+            {key: [values[pos] for pos in batch_positions] for key, values in all_encodings.items()},
+            padding=True,
+            return_tensors='pt')
+        batch_tensors = {
+            key: tensor if key == 'input_ids' else tensor.to(self.mask_transfer_dtype)
+            for key, tensor in encodings.items()}
+        if self.use_pinned_memory:
+            return {key: tensor.pin_memory() for key, tensor in batch_tensors.items()}
+        return batch_tensors
+
+    @torch.inference_mode()
     def predict(self, sentence_entity_pairs: List[Tuple[str, str]], batch_size_inference: int = 16) -> List[str]:
         """
         Определяет тональность для списка пар (предложение, текст_сущности).
@@ -74,43 +206,43 @@ class TESAPredictor:
         if not self.model or not self.tokenizer or not self.id2label:
             print("TESAPredictor: Модель, токенизатор или карта меток не загружены. Предсказание невозможно.")
             return ["ERROR_PREDICTOR_NOT_LOADED"] * len(sentence_entity_pairs)
-        all_polarities_from_all_batches = []
-        for i in tqdm(range(0, len(sentence_entity_pairs), batch_size_inference), desc="TESA Batch Inference (Predictor)"):
-            batch_pairs = sentence_entity_pairs[i:i + batch_size_inference]            
-            batch_sentences = [pair[0] for pair in batch_pairs]
-            batch_entities = [pair[1] for pair in batch_pairs]            
-            valid_indices = []
-            filtered_sentences = []
-            filtered_entities = []
-            for idx, (sent, ent) in enumerate(zip(batch_sentences, batch_entities)):
-                if sent and ent and isinstance(sent, str) and isinstance(ent, str):
-                    valid_indices.append(idx)
-                    filtered_sentences.append(sent)
-                    filtered_entities.append(ent)            
-            if not filtered_sentences:
-                all_polarities_from_all_batches.extend(["INVALID_INPUT"] * len(batch_pairs))
-                continue
-            encodings = self.tokenizer(
-                filtered_sentences,
-                filtered_entities,
-                max_length=self.max_length,
-                padding=True,
-                truncation=True,
-                return_tensors='pt')            
-            input_ids_batch = encodings['input_ids'].to(self.device)
-            attention_mask_batch = encodings['attention_mask'].to(self.device)
-            token_type_ids_batch = encodings.get('token_type_ids')
-            if token_type_ids_batch is not None:
-                token_type_ids_batch = token_type_ids_batch.to(self.device)
-            with torch.no_grad():
-                model_inputs = {'input_ids': input_ids_batch, 'attention_mask': attention_mask_batch}
-                if token_type_ids_batch is not None:
-                    model_inputs['token_type_ids'] = token_type_ids_batch                
-                outputs = self.model(**model_inputs)
-                logits_batch = outputs.logits
-                predictions_batch_ids = torch.argmax(logits_batch, dim=-1)
-            batch_polarities_temp = ["UNKNOWN_SENTIMENT"] * len(batch_pairs)
-            for original_idx_in_batch, valid_pred_id in zip(valid_indices, predictions_batch_ids.cpu().numpy()):
-                batch_polarities_temp[original_idx_in_batch] = self.id2label.get(valid_pred_id.item(), "UNKNOWN_SENTIMENT_ID")            
-            all_polarities_from_all_batches.extend(batch_polarities_temp)                
-        return all_polarities_from_all_batches
\ No newline at end of file
+        all_polarities_from_all_batches = ["INVALID_INPUT"] * len(sentence_entity_pairs)
+        valid_indices = [idx for idx, (sent, ent) in enumerate(sentence_entity_pairs)
+                         if sent and ent and isinstance(sent, str) and isinstance(ent, str)]
+        if not valid_indices:
+            return all_polarities_from_all_batches
+        if len(valid_indices) == len(sentence_entity_pairs):
+            filtered_sentences, filtered_entities = map(list, zip(*sentence_entity_pairs))
+        else:
+            filtered_sentences, filtered_entities = map(list, zip(*(sentence_entity_pairs[idx] for idx in valid_indices)))
+        all_encodings = self.tokenizer(
+            filtered_sentences,
+            filtered_entities,
+            max_length=self.max_length,
+            truncation=True,
+            padding=False,
+            return_token_type_ids=self._use_token_type_ids)
+        all_input_ids = all_encodings['input_ids']
+        sorted_positions = sorted(range(len(valid_indices)), key=lambda pos: len(all_input_ids[pos]))
+        id2label_tuple = self._id2label_tuple
+        num_labels = len(id2label_tuple)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="TESABatchPrefetch") as prefetcher:
+            next_batch_future = prefetcher.submit(self._prepare_batch, all_encodings, sorted_positions[:batch_size_inference])
+            batch_starts = range(0, len(sorted_positions), batch_size_inference)
+            if self._show_progress:
+                batch_starts = tqdm(batch_starts, desc="TESA Batch Inference (Predictor)", mininterval=1.0)
+            for i in batch_starts:
+                batch_positions = sorted_positions[i:i + batch_size_inference]
+                encodings = next_batch_future.result()
+                next_start = i + batch_size_inference
+                if next_start < len(sorted_positions):
+                    next_batch_future = prefetcher.submit(
+                        self._prepare_batch, all_encodings, sorted_positions[next_start:next_start + batch_size_inference])
+                model_inputs = {key: tensor.to(self.device, non_blocking=self.use_pinned_memory) for key, tensor in encodings.items()}
+                with torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype, enabled=self.use_autocast):
+                    outputs = self.model(**model_inputs)
+                    logits_batch = outputs.logits
+                    predictions_batch_ids = torch.argmax(logits_batch, dim=-1)
+                for pos, valid_pred_id in zip(batch_positions, predictions_batch_ids.cpu().tolist()):
+                    all_polarities_from_all_batches[valid_indices[pos]] = id2label_tuple[valid_pred_id] if 0 <= valid_pred_id < num_labels else "UNKNOWN_SENTIMENT_ID"
+        return all_polarities_from_all_batches
@@ -1,19 +1,71 @@
 # backend/vk_parser/parser.py
 
 import asyncio
+import bisect
+import aiofiles
 import aiohttp
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import json
 import datetime
 import sys 
 import os
+import time
+from dataclasses import dataclass
+import atexit
+import logging
+import queue
+import weakref
+from logging.handlers import QueueHandler, QueueListener
 from typing import List, Dict, Tuple, Any, Union
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+    def _to_jsonl_line(entry: Dict[str, Any]) -> bytes:
+        return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    _json_loads = json.loads
+    _json_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    def _to_jsonl_line(entry: Dict[str, Any]) -> bytes:
+        return (_json_encode(entry) + '\n').encode('utf-8')
+
 try:
     import config 
 except ImportError as e:
     print(f"PARSER CRITICAL: Не удалось импортировать 'config'. Ошибка: {e}. Завершение работы.")
     sys.exit(1)
 
+# Логгер парсера пишет через очередь: форматирование и вывод в stdout выполняются
+# в фоновом потоке QueueListener и не блокируют цикл событий.
+logger = logging.getLogger("vk_parser")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    _log_stream_handler = logging.StreamHandler(sys.stdout)
+    _log_stream_handler.setFormatter(logging.Formatter("PARSER %(levelname)s: %(message)s"))
+    _log_listener = QueueListener(_log_queue, _log_stream_handler)
+    logger.addHandler(QueueHandler(_log_queue))
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+# Кэш ответов groups.getById: (group_id, fields) -> (время получения, ответ).
+# Живет между вызовами fetch_vk_data, старые записи вытесняются в порядке добавления.
+_GROUP_INFO_CACHE: Dict[Tuple[str, Union[str, None]], Tuple[float, Any]] = {}
+_GROUP_INFO_CACHE_MAX_SIZE = 1024
+
+# HTTP-сессии парсера по циклам событий: в долгоживущем цикле (фоновый цикл UI) повторные
+# вызовы fetch_vk_data переиспользуют пул соединений, DNS-кэш и TLS-сессии.
+_HTTP_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+# Ограничители темпа запросов по циклам событий и токенам: лимит VK действует на токен, поэтому
+# одновременные анализы и запросы UI с одним токеном в одном цикле делят общий темп.
+_RATE_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncTokenBucket]]" = weakref.WeakKeyDictionary()
+
+def _negated_date(item: Dict[str, Any]) -> int:
+    """ Ключ для бинарного поиска по записям, упорядоченным по убыванию даты. """
+    return -item['date']
+
 class VKAPIError(Exception):
     """
     Исключение, для ошибок при взаисодействии с VK API.
@@ -28,6 +80,119 @@ class VKAPIError(Exception):
         self.message = message
         super().__init__(f"VK API Error (Code: {self.error_code}): {self.message}" if error_code else f"VK API Error: {self.message}")
 
+class _TransientVKError(VKAPIError):
+    """
+    Временная ошибка VK API (частые запросы, rate limit, неожиданный ответ),
+    после которой вызов стоит повторить.
+    """
+
+class VKAuthError(VKAPIError):
+    """
+    Ошибка авторизации в VK API (недействительный или отозванный ключ доступа).
+    Не зависит от группы, поэтому прерывает весь сбор данных.
+    """
+
+class AdmissionController:
+    """
+    Ограничитель числа одновременных запросов к VK API с изменяемым лимитом.
+    При ошибке "rate limit" лимит уменьшается вдвое, после серии успешных
+    вызовов - постепенно восстанавливается до исходного значения.
+    """
+    def __init__(self, max_concurrency: int, grow_after_successes: int = 50):
+        """
+        Args:
+            max_concurrency (int): Максимальное число одновременных запросов.
+            grow_after_successes (int, optional): Число успешных вызовов, после которого
+                                                  сниженный лимит увеличивается на единицу.
+        """
+        self._max_limit = max(1, max_concurrency)
+        self._limit = self._max_limit
+        self._active = 0
+        self._successes = 0
+        self._grow_after_successes = grow_after_successes
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """ Ожидает свободного места и занимает его. """
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+
+    async def release(self):
+        """ Освобождает место и будит одного ожидающего. """
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    def shrink(self):
+        """ Уменьшает лимит вдвое (не ниже 1). Уже выполняющиеся запросы не прерываются. """
+        new_limit = max(1, self._limit // 2)
+        if new_limit != self._limit:
+            logger.warning(f"Лимит одновременных запросов снижен: {self._limit} -> {new_limit}.")
+        self._limit = new_limit
+        self._successes = 0
+
+    async def record_success(self):
+        """ Учитывает успешный вызов и при необходимости увеличивает лимит. """
+        if self._limit >= self._max_limit:
+            return
+        self._successes += 1
+        if self._successes >= self._grow_after_successes:
+            self._successes = 0
+            async with self._cond:
+                self._limit += 1
+                self._cond.notify_all()
+
+class AsyncTokenBucket:
+    """
+    Асинхронный "token bucket" для равномерного темпа запросов к VK API.
+    Общий для всех корутин клиента: токены пополняются со скоростью rate в секунду,
+    до capacity токенов можно израсходовать подряд без ожидания.
+    """
+    def __init__(self, rate: float, capacity: int):
+        """
+        Args:
+            rate (float): Скорость пополнения (запросов в секунду).
+            capacity (int): Максимальное число накопленных токенов.
+        """
+        self._rate = rate
+        self._capacity = max(1, capacity)
+        self._tokens = float(self._capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """ Ожидает появления токена и забирает его. Ожидающие обслуживаются по очереди. """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+def get_rate_limiter(token: str) -> AsyncTokenBucket:
+    """
+    Возвращает ограничитель темпа запросов с токеном token в текущем цикле событий,
+    создавая его по VK_API_REQUESTS_PER_SECOND и VK_API_BURST при первом обращении.
+    """
+    loop_rate_limiters = _RATE_LIMITERS.setdefault(asyncio.get_running_loop(), {})
+    rate_limiter = loop_rate_limiters.get(token)
+    if rate_limiter is None:
+        rate_limiter = AsyncTokenBucket(
+            getattr(config, 'VK_API_REQUESTS_PER_SECOND', 3.0), getattr(config, 'VK_API_BURST', 3))
+        loop_rate_limiters[token] = rate_limiter
+    return rate_limiter
+
 class AsyncVKAPI:
     """
     Асинхронный клиент для взаимодействия с VK API.
@@ -39,7 +204,9 @@ class AsyncVKAPI:
                  api_base_url: str, 
                  max_retries: int = 3,
                  base_retry_delay_s: float = 1.0,
-                 rate_limit_delay_s: float = 10.0 ):
+                 rate_limit_delay_s: float = 10.0,
+                 admission_controller: Union[AdmissionController, None] = None,
+                 rate_limiter: Union[AsyncTokenBucket, None] = None):
         """
         Инициализирует асинхронный клиент VK API.
 
@@ -52,6 +219,10 @@ class AsyncVKAPI:
             base_retry_delay_s (float, optional): Начальная задержка в секундах для повтора
                                                   при ошибке "слишком много запросов".
             rate_limit_delay_s (float, optional): Задержка в секундах при ошибке "rate limit".
+            admission_controller (Union[AdmissionController, None], optional): Ограничитель одновременных
+                                                  запросов, который сужается при ошибке "rate limit".
+            rate_limiter (Union[AsyncTokenBucket, None], optional): Ограничитель темпа запросов. По умолчанию
+                                                  общий для всех клиентов с этим токеном в цикле событий (get_rate_limiter).
         """
         self.session = session
         self.token = token
@@ -60,7 +231,10 @@ class AsyncVKAPI:
         self.max_retries = max_retries
         self.base_retry_delay_s = base_retry_delay_s
         self.rate_limit_delay_s = rate_limit_delay_s
-        print(f"AsyncVKAPI инициализирован для v{api_version}.")
+        self.admission_controller = admission_controller
+        self.rate_limiter = rate_limiter
+        self._jitter_wait = wait_random_exponential(multiplier=base_retry_delay_s, max=30)
+        logger.info(f"AsyncVKAPI инициализирован для v{api_version}.")
 
     async def _call_method(self, method_name: str, params: dict = None) -> Union[Dict[str, Any], List[Any], None]:
         """
@@ -80,87 +254,153 @@ class AsyncVKAPI:
         params["access_token"] = self.token
         params["v"] = self.api_version
         url = f"{self.api_base_url}{method_name}"         
-        for attempt in range(self.max_retries):
-            try:            
-                async with self.session.post(url, data=params) as response:
-                    if 'application/json' not in response.headers.get('Content-Type', ''):
-                        text_response = await response.text()
-                        print(f"PARSER WARNING: Неожиданный Content-Type от VK API для {method_name}: {response.headers.get('Content-Type')}. Ответ: {text_response[:200]}")
-                        if attempt < self.max_retries - 1:
-                             await asyncio.sleep(self.base_retry_delay_s * (2**attempt))
-                             continue
-                        raise VKAPIError(f"Unexpected Content-Type: {response.headers.get('Content-Type')}")
-                    data = await response.json()
-                    response.raise_for_status() 
-                    if "error" in data:
-                        error_info = data["error"]
-                        error_code = error_info.get("error_code")
-                        error_msg = error_info.get("error_msg", "Unknown API error")
-                        print(f"PARSER WARNING: VK API Error ({method_name}): Code {error_code}, Msg: '{error_msg}'. Attempt {attempt+1}/{self.max_retries}.")
-                        if error_code == 6: 
-                            sleep_time = self.base_retry_delay_s * (2 ** attempt); await asyncio.sleep(sleep_time)
-                        elif error_code == 29: 
-                            sleep_time = self.rate_limit_delay_s + (attempt * 5); await asyncio.sleep(sleep_time)
-                        else: raise VKAPIError(error_msg, error_code=error_code)
-                        if attempt == self.max_retries - 1: raise VKAPIError(f"VK API Error ({method_name}) не устранена: {error_msg}", error_code=error_code)
-                        continue                    
-                    if hasattr(config, 'DELAY_AFTER_API_CALL_SECONDS'):
-                        await asyncio.sleep(config.DELAY_AFTER_API_CALL_SECONDS)
-                    return data.get("response")            
-            except aiohttp.ClientError as e: 
-                print(f"PARSER WARNING: HTTP/Network Error ({method_name}): {e}. Attempt {attempt+1}/{self.max_retries}.")
-                if attempt == self.max_retries - 1:
-                    print(f"PARSER CRITICAL: HTTP/Network Error ({method_name}) не устранена: {e}")
-                    raise VKAPIError(f"Network/HTTP error after retries: {e}") from e 
-                await asyncio.sleep(self.base_retry_delay_s * (2 ** attempt))        
-        final_msg = f"Failed to call {method_name} after {self.max_retries} retries."
-        print(f"PARSER ERROR: {final_msg}")
-        raise VKAPIError(final_msg)
+        try:
+            async for attempt in AsyncRetrying(
+                    wait=self._retry_wait,
+                    stop=stop_after_attempt(self.max_retries),
+                    retry=retry_if_exception_type((aiohttp.ClientError, _TransientVKError)),
+                    reraise=True):
+                with attempt:
+                    return await self._call_method_once(method_name, url, params, attempt.retry_state.attempt_number)
+        except aiohttp.ClientError as e:
+            logger.critical(f"HTTP/Network Error ({method_name}) не устранена: {e}")
+            raise VKAPIError(f"Network/HTTP error after retries: {e}") from e
+        except _TransientVKError as e:
+            logger.error(f"Failed to call {method_name} after {self.max_retries} retries.")
+            raise VKAPIError(f"VK API Error ({method_name}) не устранена: {e.message}", error_code=e.error_code) from e
+
+    def _retry_wait(self, retry_state: RetryCallState) -> float:
+        """
+        Пауза перед повтором: экспоненциальная со случайным разбросом, чтобы
+        конкурентные запросы не повторялись синхронно. При ошибке "rate limit"
+        к ней добавляется rate_limit_delay_s.
+        """
+        wait_s = self._jitter_wait(retry_state)
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        if isinstance(error, _TransientVKError) and error.error_code == 29:
+            wait_s += self.rate_limit_delay_s
+        return wait_s
+
+    async def _call_method_once(self, method_name: str, url: str, params: dict, attempt_number: int) -> Union[Dict[str, Any], List[Any], None]:
+        """
+        Одна попытка вызова метода VK API.
+
+        Raises:
+            _TransientVKError: При временной ошибке, после которой вызов стоит повторить.
+            VKAPIError: При неустранимой ошибке VK API.
+            aiohttp.ClientError: При сетевой ошибке.
+        """
+        await (self.rate_limiter if self.rate_limiter is not None else get_rate_limiter(self.token)).acquire()
+        try:
+            async with self.session.post(url, data=params) as response:
+                response.raise_for_status()
+                # Content-Type не проверяется: VK иногда отвечает с text/javascript.
+                data = await response.json(loads=_json_loads, content_type=None)
+        except ValueError as e:
+            logger.warning(f"Некорректный JSON в ответе VK API ({method_name}): {e}. Attempt {attempt_number}/{self.max_retries}.")
+            raise _TransientVKError(f"Invalid JSON response: {e}") from e
+        except aiohttp.ClientError as e:
+            logger.warning(f"HTTP/Network Error ({method_name}): {e}. Attempt {attempt_number}/{self.max_retries}.")
+            raise
+        if "error" in data:
+            error_info = data["error"]
+            error_code = error_info.get("error_code")
+            error_msg = error_info.get("error_msg", "Unknown API error")
+            logger.warning(f"VK API Error ({method_name}): Code {error_code}, Msg: '{error_msg}'. Attempt {attempt_number}/{self.max_retries}.")
+            if error_code == 29 and self.admission_controller is not None:
+                self.admission_controller.shrink()
+            if error_code in (6, 29):
+                raise _TransientVKError(error_msg, error_code=error_code)
+            if error_code in (5, 28):
+                raise VKAuthError(error_msg, error_code=error_code)
+            raise VKAPIError(error_msg, error_code=error_code)
+        if self.admission_controller is not None:
+            await self.admission_controller.record_success()
+        return data.get("response")
+
     async def groups_getById(self, group_id: str, fields: str = None):
-        """ Вызывает метод VK API groups.getById. """
+        """
+        Вызывает метод VK API groups.getById.
+        Успешные ответы кэшируются на уровне процесса на VK_GROUP_INFO_CACHE_TTL_SECONDS.
+        """
+        cache_key = (group_id, fields)
+        cached = _GROUP_INFO_CACHE.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < config.VK_GROUP_INFO_CACHE_TTL_SECONDS:
+            return cached[1]
         params = {"group_id": group_id}
         if fields: params["fields"] = fields
-        return await self._call_method("groups.getById", params)
+        response = await self._call_method("groups.getById", params)
+        if response:
+            _GROUP_INFO_CACHE.pop(cache_key, None)
+            if len(_GROUP_INFO_CACHE) >= _GROUP_INFO_CACHE_MAX_SIZE:
+                del _GROUP_INFO_CACHE[next(iter(_GROUP_INFO_CACHE))]
+            _GROUP_INFO_CACHE[cache_key] = (time.monotonic(), response)
+        return response
     async def wall_get(self, owner_id: int, count: int, offset: int, **kwargs):
         """ Вызывает метод VK API wall.get с фильтром 'owner'. """
         params = {"owner_id": owner_id, "count": count, "offset": offset, "filter": "owner", **kwargs}
         return await self._call_method("wall.get", params)
-    async def wall_getComments(self, owner_id: int, post_id: int, count: int, offset: int, **kwargs):
-        """ Вызывает метод VK API wall.getComments. """
-        params = {"owner_id": owner_id, "post_id": post_id, "count": count, "offset": offset, **kwargs}
-        params.setdefault('sort', 'asc')
-        params.setdefault('thread_items_count', 0) 
-        return await self._call_method("wall.getComments", params)
+    async def execute(self, code: str):
+        """ Вызывает метод VK API execute с кодом VKScript. """
+        return await self._call_method("execute", {"code": code})
+    async def wall_getComments_many(self, requests: List[Dict[str, Any]]) -> List[Union[Dict[str, Any], None]]:
+        """
+        Выполняет несколько вызовов wall.getComments одним запросом execute.
+
+        Args:
+            requests (List[Dict[str, Any]]): Параметры вызовов (owner_id, post_id, count, offset, ...),
+                                             не более VK_EXECUTE_MAX_CALLS штук.
+
+        Returns:
+            List[Union[Dict[str, Any], None]]: Ответы в порядке запросов; None для вызовов,
+                                               завершившихся ошибкой на стороне VK.
+        """
+        calls = []
+        for request_params in requests:
+            call_params = {'sort': 'asc', 'thread_items_count': 0, **request_params}
+            calls.append(f"API.wall.getComments({json.dumps(call_params)})")
+        response = await self.execute(f"return [{','.join(calls)}];")
+        if not isinstance(response, list):
+            return [None] * len(requests)
+        return [chunk if isinstance(chunk, dict) else None for chunk in response]
     
+@dataclass(frozen=True, slots=True)
+class ProcessorConfig:
+    """
+    Общие для всех групп параметры парсинга одной сессии.
+
+    Attributes:
+        start_ts (int): Начальная метка времени для парсинга.
+        end_ts (int): Конечная метка времени для парсинга.
+        posts_chunk_size (int): Количество постов, запрашиваемых за один вызов API.
+        comments_chunk_size (int): Количество комментариев, запрашиваемых за один вызов API.
+        max_comments_per_post (Union[int, None]): Максимальное количество комментариев для парсинга с одного поста.
+    """
+    start_ts: int
+    end_ts: int
+    posts_chunk_size: int
+    comments_chunk_size: int
+    max_comments_per_post: Union[int, None]
+
 class VKGroupProcessor:
     """
     Класс, для парсинга  одной указанной VK группы за определенный период времени.
     """
     def __init__(self, vk_api_client: AsyncVKAPI, group_identifier: str,
-                 start_timestamp: int, end_timestamp: int, semaphore: asyncio.Semaphore,
-                 posts_chunk_size: int, comments_chunk_size: int, 
-                 max_comments_per_post: Union[int, None]):
+                 settings: ProcessorConfig, semaphore: AdmissionController):
         """
         Инициализирует процессор для парсинга одной группы.
 
         Args:
             vk_api_client (AsyncVKAPI): Экземпляр клиента для взаимодействия с VK API.
             group_identifier (str): ID или короткое имя группы VK.
-            start_timestamp (int): Начальная метка времени для парсинга.
-            end_timestamp (int): Конечная метка времени для парсинга.
-            semaphore (asyncio.Semaphore): Семафор для ограничения одновременных запросов к API в рамках обработки этой группы.
-            posts_chunk_size (int): Количество постов, запрашиваемых за один вызов API.
-            comments_chunk_size (int): Количество комментариев, запрашиваемых за один вызов API.
-            max_comments_per_post (Union[int, None]): Максимальное количество комментариев для парсинга с одного поста.
+            settings (ProcessorConfig): Общие параметры парсинга (период, размеры чанков, лимит комментариев).
+            semaphore (AdmissionController): Ограничитель одновременных запросов к API (общий для всех групп).
         """
         self.api = vk_api_client
         self.group_identifier = group_identifier
-        self.start_ts = start_timestamp
-        self.end_ts = end_timestamp
+        self.settings = settings
         self.semaphore = semaphore
-        self.posts_chunk_size = posts_chunk_size
-        self.comments_chunk_size = comments_chunk_size
-        self.max_comments_per_post = max_comments_per_post
         self.group_info: Union[Dict[str, Any], None] = None
         self.vk_group_id_numeric: Union[int, None] = None
         
@@ -171,17 +411,18 @@ class VKGroupProcessor:
         Returns:
             bool: True, если информация о группе успешно получена, иначе False.
         """
-        print(f"PARSER INFO: Получение информации о группе: {self.group_identifier}")
+        logger.info(f"Получение информации о группе: {self.group_identifier}")
         try:
             group_data_list = await self.api.groups_getById(group_id=str(self.group_identifier), fields="name,screen_name")
             if group_data_list and isinstance(group_data_list, list) and group_data_list:
                 group = group_data_list[0]
                 self.group_info = {'vk_group_id': group['id'], 'screen_name': group.get('screen_name'), 'name': group.get('name')}
                 self.vk_group_id_numeric = group['id']
-                print(f"PARSER INFO: Информация для группы '{self.group_info.get('name', self.vk_group_id_numeric)}' (ID: {self.vk_group_id_numeric}) получена.")
+                logger.info(f"Информация для группы '{self.group_info.get('name', self.vk_group_id_numeric)}' (ID: {self.vk_group_id_numeric}) получена.")
                 return True
-        except VKAPIError as e: print(f"PARSER ERROR: VKAPIError при получении информации о группе '{self.group_identifier}': {e}")
-        except Exception as e: print(f"PARSER ERROR: Неожиданная ошибка при получении информации о группе '{self.group_identifier}': {e}")
+        except VKAuthError: raise
+        except VKAPIError as e: logger.error(f"VKAPIError при получении информации о группе '{self.group_identifier}': {e}")
+        except Exception as e: logger.error(f"Неожиданная ошибка при получении информации о группе '{self.group_identifier}': {e}")
         return False
         
     async def _parse_posts(self) -> List[Dict[str, Any]]:
@@ -194,173 +435,319 @@ class VKGroupProcessor:
         if self.vk_group_id_numeric is None: return []
         collected_posts_data = []
         offset = 0
-        print(f"PARSER INFO: Парсинг постов для группы ID {self.vk_group_id_numeric}...")
+        logger.info(f"Парсинг постов для группы ID {self.vk_group_id_numeric}...")
         while True:
             async with self.semaphore:
                 try:
-                    wall_chunk = await self.api.wall_get(owner_id=-self.vk_group_id_numeric, count=self.posts_chunk_size, offset=offset)
-                    if not wall_chunk or not wall_chunk.get('items'): print(f"PARSER INFO: Больше постов не найдено для гр. {self.vk_group_id_numeric} (offset {offset})."); break
+                    wall_chunk = await self.api.wall_get(owner_id=-self.vk_group_id_numeric, count=self.settings.posts_chunk_size, offset=offset)
+                    if not wall_chunk or not wall_chunk.get('items'): logger.info(f"Больше постов не найдено для гр. {self.vk_group_id_numeric} (offset {offset})."); break
                     items = wall_chunk['items']
                     if not items: break
                     oldest_post_date_in_chunk = items[-1]['date']
-                    stop_fetching_posts = oldest_post_date_in_chunk < self.start_ts
-                    for post_item in items:
-                        if post_item['date'] > self.end_ts: continue
-                        if post_item['date'] >= self.start_ts:
-                            post_data = {'vk_post_id': post_item['id'], 'owner_id': post_item['owner_id'],
-                                         'date': post_item['date'], 'text': post_item.get('text', '').strip(),
-                                         'comments_api_count': post_item.get('comments', {}).get('count', 0)}
-                            if post_data['text']: collected_posts_data.append(post_data)
-                    if stop_fetching_posts: print(f"PARSER INFO: Достигнут конец периода для гр. {self.vk_group_id_numeric}."); break
-                    offset += self.posts_chunk_size
-                    if len(items) < self.posts_chunk_size: print(f"PARSER INFO: Достигнут конец стены гр. {self.vk_group_id_numeric}."); break
-                except VKAPIError as e: print(f"PARSER ERROR: VKAPIError при парсинге постов гр. {self.vk_group_id_numeric} (offset {offset}): {e}"); break
-                except Exception as e: print(f"PARSER ERROR: Неожиданная ошибка при парсинге постов гр. {self.vk_group_id_numeric} (offset {offset}): {e}"); break
-        print(f"PARSER INFO: Сбор постов для гр. {self.vk_group_id_numeric} завершен. Собрано: {len(collected_posts_data)}.")
+                    stop_fetching_posts = oldest_post_date_in_chunk < self.settings.start_ts
+                    # Посты стены идут по убыванию даты (кроме закрепленного, который может быть первым),
+                    # поэтому границы периода находятся бинарным поиском.
+                    posts_in_range, ordered_items = [], items
+                    if offset == 0 and items[0].get('is_pinned'):
+                        if self.settings.start_ts <= items[0]['date'] <= self.settings.end_ts: posts_in_range.append(items[0])
+                        ordered_items = items[1:]
+                    first_idx = bisect.bisect_left(ordered_items, -self.settings.end_ts, key=_negated_date)
+                    cut_idx = bisect.bisect_right(ordered_items, -self.settings.start_ts, lo=first_idx, key=_negated_date)
+                    posts_in_range.extend(ordered_items[first_idx:cut_idx])
+                    for post_item in posts_in_range:
+                        post_data = {'vk_post_id': post_item['id'], 'owner_id': post_item['owner_id'],
+                                     'date': post_item['date'], 'text': post_item.get('text', '').strip(),
+                                     'comments_api_count': post_item.get('comments', {}).get('count', 0)}
+                        if post_data['text']: collected_posts_data.append(post_data)
+                    if stop_fetching_posts: logger.info(f"Достигнут конец периода для гр. {self.vk_group_id_numeric}."); break
+                    offset += self.settings.posts_chunk_size
+                    if len(items) < self.settings.posts_chunk_size: logger.info(f"Достигнут конец стены гр. {self.vk_group_id_numeric}."); break
+                except VKAuthError: raise
+                except VKAPIError as e: logger.error(f"VKAPIError при парсинге постов гр. {self.vk_group_id_numeric} (offset {offset}): {e}"); break
+                except Exception as e: logger.error(f"Неожиданная ошибка при парсинге постов гр. {self.vk_group_id_numeric} (offset {offset}): {e}"); break
+        logger.info(f"Сбор постов для гр. {self.vk_group_id_numeric} завершен. Собрано: {len(collected_posts_data)}.")
         return collected_posts_data
 
-    async def _parse_comments_for_post(self, vk_post_id: int) -> List[Dict[str, Any]]:
+    def _consume_comments_chunk(self, post_state: Dict[str, Any], items: List[Dict[str, Any]], count_requested: int) -> bool:
         """
-        Парсинга комментариев к одному посту за указанный период.
+        Добавляет комментарии из очередной порции ответа к состоянию поста.
 
         Args:
-            vk_post_id (int): ID поста, для которого собираются комментарии.
+            post_state (Dict[str, Any]): Состояние сбора комментариев поста (offset, fetched_count, comments).
+            items (List[Dict[str, Any]]): Комментарии из ответа API.
+            count_requested (int): Сколько комментариев запрашивалось.
 
         Returns:
-            List[Dict[str, Any]]: Список словарей, где каждый словарь представляет комментарий.
+            bool: True, если для поста нужно запросить следующую порцию.
         """
-        if self.vk_group_id_numeric is None: return []
-        collected_comments_data = []
-        offset, fetched_count = 0, 0
-        while True:
-            if self.max_comments_per_post is not None and fetched_count >= self.max_comments_per_post: break
-            async with self.semaphore:
-                try:
-                    count_to_request = self.comments_chunk_size
-                    if self.max_comments_per_post is not None:
-                        remaining = self.max_comments_per_post - fetched_count
-                        if remaining <= 0: break
-                        count_to_request = min(self.comments_chunk_size, remaining)
-                    comments_chunk = await self.api.wall_getComments(
-                        owner_id=-self.vk_group_id_numeric, post_id=vk_post_id, count=count_to_request, offset=offset) 
-                    if not comments_chunk or not comments_chunk.get('items'): break
-                    items = comments_chunk['items']
-                    if not items: break
-                    stop_for_this_post = False
-                    for item in items:
-                        if item['date'] > self.end_ts: stop_for_this_post = True; break
-                        if item['date'] < self.start_ts: continue
-                        text = item.get('text', '').strip()
-                        if text:
-                            collected_comments_data.append({'vk_comment_id': item['id'], 'from_id': item.get('from_id'),
-                                                            'date': item['date'], 'text': text})
-                            fetched_count += 1
-                            if self.max_comments_per_post is not None and fetched_count >= self.max_comments_per_post:
-                                stop_for_this_post = True; break
-                    if stop_for_this_post: break
-                    offset += len(items)
-                    if len(items) < count_to_request: break
-                except VKAPIError as e:
-                    if e.error_code == 18: print(f"PARSER WARNING: Пост {vk_post_id} удален/скрыт или комментарии закрыты.")
-                    else: print(f"PARSER ERROR: VKAPIError при парсинге комментариев к посту {vk_post_id}: {e}")
-                    break
-                except Exception as e: print(f"PARSER ERROR: Неожиданная ошибка при парсинге комментариев поста {vk_post_id}: {e}"); break
-        return collected_comments_data
-
-    async def process_and_write_to_file(self, writer_lock: asyncio.Lock, output_file_path: str) -> int:
+        start_ts, end_ts = self.settings.start_ts, self.settings.end_ts
+        # Комментарии идут по возрастанию даты: все, что после первого комментария позже периода, отбрасывается.
+        cut_idx = next((i for i, item in enumerate(items) if item['date'] > end_ts), None)
+        new_comments = [
+            {'vk_comment_id': item['id'], 'from_id': item.get('from_id'), 'date': item['date'], 'text': text}
+            for item in (items if cut_idx is None else items[:cut_idx])
+            if item['date'] >= start_ts and (text := item.get('text', '').strip())]
+        max_comments = self.settings.max_comments_per_post
+        if max_comments is not None and post_state['fetched_count'] + len(new_comments) >= max_comments:
+            post_state['comments'].extend(new_comments[:max_comments - post_state['fetched_count']])
+            post_state['fetched_count'] = max_comments
+            return False
+        post_state['comments'].extend(new_comments)
+        post_state['fetched_count'] += len(new_comments)
+        if cut_idx is not None: return False
+        post_state['offset'] += len(items)
+        return len(items) >= count_requested
+
+    def _comments_count_to_request(self, post_state: Dict[str, Any]) -> int:
+        """ Размер следующей порции комментариев для поста (0 - лимит исчерпан). """
+        if self.settings.max_comments_per_post is None: return self.settings.comments_chunk_size
+        return max(0, min(self.settings.comments_chunk_size, self.settings.max_comments_per_post - post_state['fetched_count']))
+
+    async def _fetch_comments_batch(self, batch: List[Tuple[int, int, int]]) -> List[Union[Dict[str, Any], None]]:
+        """
+        Запрашивает порции комментариев для нескольких постов одним вызовом execute.
+
+        Args:
+            batch (List[Tuple[int, int, int]]): Тройки (vk_post_id, offset, count).
+
+        Returns:
+            List[Union[Dict[str, Any], None]]: Ответы wall.getComments в порядке batch.
+        """
+        async with self.semaphore:
+            try:
+                return await self.api.wall_getComments_many([
+                    {'owner_id': -self.vk_group_id_numeric, 'post_id': vk_post_id, 'count': count, 'offset': offset}
+                    for vk_post_id, offset, count in batch])
+            except VKAuthError: raise
+            except VKAPIError as e:
+                logger.error(f"VKAPIError при пакетном парсинге комментариев к постам {[post[0] for post in batch]}: {e}")
+            except Exception as e:
+                logger.error(f"Неожиданная ошибка при пакетном парсинге комментариев к постам {[post[0] for post in batch]}: {e}")
+            return [None] * len(batch)
+
+    async def _parse_comments_for_posts(self, vk_post_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Парсинг комментариев к нескольким постам за указанный период.
+        Порции комментариев разных постов объединяются в запросы execute
+        (до VK_EXECUTE_MAX_CALLS вызовов wall.getComments за один HTTP-запрос),
+        запросы выполняются конкурентно в пределах ограничителя self.semaphore.
+
+        Args:
+            vk_post_ids (List[int]): ID постов, для которых собираются комментарии.
+
+        Returns:
+            Dict[int, List[Dict[str, Any]]]: Комментарии для каждого поста.
+        """
+        if self.vk_group_id_numeric is None: return {}
+        states = {vk_post_id: {'offset': 0, 'fetched_count': 0, 'comments': []} for vk_post_id in vk_post_ids}
+        pending = [vk_post_id for vk_post_id in vk_post_ids if self._comments_count_to_request(states[vk_post_id]) > 0]
+        batch_size = max(1, config.VK_EXECUTE_MAX_CALLS)
+        while pending:
+            requests = [(vk_post_id, states[vk_post_id]['offset'], self._comments_count_to_request(states[vk_post_id]))
+                        for vk_post_id in pending]
+            batches = [requests[i:i + batch_size] for i in range(0, len(requests), batch_size)]
+            batch_results = await asyncio.gather(*(self._fetch_comments_batch(batch) for batch in batches))
+            next_pending = []
+            for batch, results in zip(batches, batch_results):
+                for (vk_post_id, _, count_requested), comments_chunk in zip(batch, results):
+                    if comments_chunk is None:
+                        logger.warning(f"Не удалось получить комментарии к посту {vk_post_id} (пост удален/скрыт, комментарии закрыты или ошибка API).")
+                        continue
+                    items = comments_chunk.get('items')
+                    if not items: continue
+                    state = states[vk_post_id]
+                    if self._consume_comments_chunk(state, items, count_requested) and self._comments_count_to_request(state) > 0:
+                        next_pending.append(vk_post_id)
+            pending = next_pending
+        return {vk_post_id: state['comments'] for vk_post_id, state in states.items()}
+
+    async def process_and_write_to_file(self, write_queue: "asyncio.Queue[Union[Tuple[int, bytes], None]]") -> int:
         """
         Полный цикл обработки для одной группы: получение информации о группе,
         парсинг постов, асинхронный парсинг комментариев для этих постов и
-        запись всех собранных данных в указанный файл.
+        передача собранных данных задаче записи окнами по VK_POSTS_WRITE_WINDOW постов.
 
         Args:
-            writer_lock (asyncio.Lock): Асинхронный лок для синхронизации записи в файл.
-            output_file_path (str): Путь к выходному файлу JSONL.
+            write_queue (asyncio.Queue): Очередь задачи записи (_jsonl_writer), в которую
+                                         помещаются пары (число постов, строки JSONL окна).
 
         Returns:
-            int: Количество успешно обработанных и сохраненных постов для данной группы.
+            int: Количество обработанных постов группы, переданных на запись.
         """
-        print(f"PARSER INFO: --- Начало полной обработки группы: {self.group_identifier} ---")
+        logger.info(f"--- Начало полной обработки группы: {self.group_identifier} ---")
         if not await self._fetch_group_info() or self.vk_group_id_numeric is None: return 0
         posts_in_period = await self._parse_posts()
-        if not posts_in_period: print(f"PARSER INFO: Постов не найдено для группы {self.group_identifier}."); return 0
-        all_group_data_to_write = []
-        for post_data in posts_in_period:
-            comments_for_this_post = []
-            if post_data['comments_api_count'] > 0:
-                try: comments_for_this_post = await self._parse_comments_for_post(post_data['vk_post_id'])
-                except Exception as e_comm: print(f"PARSER ERROR: Ошибка при получении комментариев для поста {post_data['vk_post_id']}: {e_comm}")
-            all_group_data_to_write.append({
-                "vk_group_id": self.vk_group_id_numeric,
-                "group_screen_name": self.group_info.get('screen_name') if self.group_info else None,
-                "group_name": self.group_info.get('name') if self.group_info else None,
-                **post_data, "comments": comments_for_this_post   })
+        if not posts_in_period: logger.info(f"Постов не найдено для группы {self.group_identifier}."); return 0
+        group_fields = {
+            "vk_group_id": self.vk_group_id_numeric,
+            "group_screen_name": self.group_info.get('screen_name') if self.group_info else None,
+            "group_name": self.group_info.get('name') if self.group_info else None}
         group_posts_saved = 0
-        if all_group_data_to_write:
-            async with writer_lock:
+        # Посты обрабатываются окнами от старых к новым (хронологический порядок в файле):
+        # комментарии окна собираются и сразу записываются, в памяти держится только одно окно.
+        chronological_posts = posts_in_period[::-1]
+        window_size = max(1, config.VK_POSTS_WRITE_WINDOW)
+        for window_start in range(0, len(chronological_posts), window_size):
+            window_posts = chronological_posts[window_start:window_start + window_size]
+            comments_by_post: Dict[int, List[Dict[str, Any]]] = {}
+            post_ids_with_comments = [post_data['vk_post_id'] for post_data in window_posts if post_data['comments_api_count'] > 0]
+            if post_ids_with_comments:
                 try:
-                    with open(output_file_path, 'a', encoding='utf-8') as f_out:
-                        for entry_to_write in reversed(all_group_data_to_write): # reversed для хронологического порядка
-                            f_out.write(json.dumps(entry_to_write, ensure_ascii=False) + '\n')
-                            group_posts_saved += 1
-                    print(f"PARSER INFO: Сохранено {group_posts_saved} постов для группы {self.vk_group_id_numeric}.")
-                except IOError as e_io:
-                    print(f"PARSER CRITICAL: Ошибка записи в файл {output_file_path} для группы {self.group_identifier}: {e_io}")
-                    return 0
-        print(f"PARSER INFO: --- Завершение обработки группы: {self.group_identifier}. Сохранено: {group_posts_saved} ---")
+                    comments_by_post = await self._parse_comments_for_posts(post_ids_with_comments)
+                except VKAuthError: raise
+                except Exception as e_comm: logger.error(f"Ошибка при получении комментариев для постов группы {self.group_identifier}: {e_comm}")
+            lines_to_write = [
+                _to_jsonl_line({**group_fields, **post_data, "comments": comments_by_post.get(post_data['vk_post_id'], [])})
+                for post_data in window_posts]
+            await write_queue.put((len(lines_to_write), b''.join(lines_to_write)))
+            group_posts_saved += len(lines_to_write)
+        logger.info(f"Передано на запись {group_posts_saved} постов для группы {self.vk_group_id_numeric}.")
+        logger.info(f"--- Завершение обработки группы: {self.group_identifier}. Постов: {group_posts_saved} ---")
         return group_posts_saved
 
+async def _jsonl_writer(write_queue: "asyncio.Queue[Union[Tuple[int, bytes], None]]", f_out, output_file_path: str) -> int:
+    """
+    Единственная задача, которая пишет в выходной файл: забирает из очереди окна
+    строк JSONL до получения None. Файл открывает и закрывает вызывающая сторона.
+    После ошибки записи продолжает разбирать очередь, чтобы не блокировать процессоры групп,
+    и пробрасывает ошибку после получения None: файл с пропусками не выдается за результат.
+
+    Returns:
+        int: Количество постов, записанных в файл.
+
+    Raises:
+        Exception: Первая ошибка записи в файл.
+    """
+    posts_written = 0
+    write_error: Union[Exception, None] = None
+    while (item := await write_queue.get()) is not None:
+        if write_error is not None: continue
+        posts_count, data = item
+        try:
+            await f_out.write(data)
+            posts_written += posts_count
+        except Exception as e_write:
+            logger.critical(f"Ошибка записи в файл {output_file_path}: {e_write}")
+            write_error = e_write
+    if write_error is not None:
+        raise write_error
+    return posts_written
+
+async def _process_group(processor: VKGroupProcessor, write_queue: "asyncio.Queue[Union[Tuple[int, bytes], None]]") -> int:
+    """
+    Обрабатывает одну группу, не давая ее ошибкам отменить обработку остальных групп.
+    Пробрасывается только VKAuthError.
+
+    Returns:
+        int: Количество сохраненных постов группы (0 при ошибке).
+    """
+    try:
+        return await processor.process_and_write_to_file(write_queue)
+    except VKAuthError: raise
+    except Exception as e:
+        logger.error(f"Ошибка при обработке группы '{processor.group_identifier}': {e}")
+        return 0
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Возвращает HTTP-сессию для VK API в текущем цикле событий, создавая ее при первом обращении.
+    Сессию используют парсер и запросы UI, поэтому прогретые соединения с api.vk.com общие.
+    """
+    loop = asyncio.get_running_loop()
+    http_session = _HTTP_SESSIONS.get(loop)
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.VK_HTTP_CONNECTION_LIMIT, limit_per_host=config.VK_HTTP_CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=config.VK_HTTP_DNS_CACHE_TTL_SECONDS, enable_cleanup_closed=True)
+        http_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300))
+        _HTTP_SESSIONS[loop] = http_session
+    return http_session
+
+async def close_http_session():
+    """
+    Закрывает HTTP-сессию текущего цикла событий, если она была создана.
+    Вызывается перед остановкой цикла: фоновый цикл UI закрывает ее при завершении процесса,
+    а вызывающие fetch_vk_data через asyncio.run - перед выходом из корутины.
+    """
+    http_session = _HTTP_SESSIONS.pop(asyncio.get_running_loop(), None)
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
 async def fetch_vk_data(group_identifiers: List[str], 
                         start_date_obj: datetime.date, 
-                        end_date_obj: datetime.date) -> str:
+                        end_date_obj: datetime.date,
+                        output_file: Union[str, None] = None) -> str:
     """
     Основная асинхронная функция для сбора данных из VK.
+    Все группы обрабатываются одновременно; общее число запросов ограничивает AdmissionController.
 
     Args:
         group_identifiers (List[str]): Список ID или коротких имен групп VK.
         start_date_obj (datetime.date): Начальная дата периода для парсинга.
         end_date_obj (datetime.date): Конечная дата периода для парсинга.
+        output_file (Union[str, None]): Путь к выходному файлу JSONL. По умолчанию
+            config.PARSED_DATA_OUTPUT_FILE; одновременные вызовы должны передавать разные пути.
 
     Returns:
         str: Путь к файлу JSONL, содержащему собранные данные.
 
     Raises:
         ValueError: Если начальная дата позже конечной, или если VK_SERVICE_TOKEN не установлен.
-        IOError: Если не удалось создать/очистить выходной файл.
+        IOError: Если не удалось создать/очистить или открыть для записи выходной файл.
         VKAPIError: Если происходят неустранимые ошибки при взаимодействии с VK API.
+        Exception: Ошибка записи в выходной файл (файл неполон).
     """
     start_ts = int(datetime.datetime.combine(start_date_obj, datetime.time.min).timestamp())
     end_ts = int(datetime.datetime.combine(end_date_obj, datetime.time.max).timestamp())
     if start_ts > end_ts:
-        print("PARSER ERROR: Начальная дата не может быть позже конечной.")
+        logger.error("Начальная дата не может быть позже конечной.")
         raise ValueError("Начальная дата не может быть позже конечной.")
-    output_file = config.PARSED_DATA_OUTPUT_FILE
+    output_file = output_file or config.PARSED_DATA_OUTPUT_FILE
+    try:
+        with open(output_file, 'w', encoding='utf-8') as f_clear: logger.info(f"Файл результатов {output_file} очищен/создан.")
+    except IOError as e: logger.critical(f"Не удалось очистить/создать файл {output_file}: {e}"); raise 
+    if not config.VK_SERVICE_TOKEN: 
+        logger.critical("VK_SERVICE_TOKEN не установлен в конфигурации! Парсинг невозможен.")
+        raise ValueError("VK_SERVICE_TOKEN не установлен.")
+    http_session = get_http_session()
+    # Общий для всех групп ограничитель: суммарное число запросов в полете
+    # не превышает размер пула соединений и снижается при ошибке "rate limit".
+    admission_controller = AdmissionController(min(
+        config.VK_HTTP_CONNECTION_LIMIT_PER_HOST,
+        len(group_identifiers) * config.CONCURRENT_API_REQUESTS_PER_GROUP_SEMAPHORE))
+    vk_api_client = AsyncVKAPI(
+        http_session, config.VK_SERVICE_TOKEN, config.VK_API_VERSION, config.VK_API_BASE_URL,
+        admission_controller=admission_controller)
+    processor_settings = ProcessorConfig(
+        start_ts=start_ts, end_ts=end_ts,
+        posts_chunk_size=config.POSTS_CHUNK_SIZE, comments_chunk_size=config.COMMENTS_CHUNK_SIZE,
+        max_comments_per_post=config.MAX_COMMENTS_PER_POST_SESSION)
+    write_queue: "asyncio.Queue[Union[Tuple[int, bytes], None]]" = asyncio.Queue(maxsize=config.VK_WRITE_QUEUE_MAX_WINDOWS)
+    # Файл открывается до запуска обработки групп, чтобы ошибка открытия дошла до вызывающей стороны.
+    try:
+        f_out = await aiofiles.open(output_file, 'ab')
+    except IOError as e_io:
+        logger.critical(f"Не удалось открыть файл {output_file} для записи: {e_io}")
+        raise
+    writer_task = asyncio.create_task(_jsonl_writer(write_queue, f_out, output_file))
+    # Ошибка авторизации отменяет обработку всех групп; прочие ошибки гасятся внутри _process_group.
     try:
-        with open(output_file, 'w', encoding='utf-8') as f_clear: print(f"PARSER INFO: Файл результатов {output_file} очищен/создан.")
-    except IOError as e: print(f"PARSER CRITICAL: Не удалось очистить/создать файл {output_file}: {e}"); raise 
-    total_posts_saved_overall = 0
-    session_timeout = aiohttp.ClientTimeout(total=300) 
-    async with aiohttp.ClientSession(timeout=session_timeout) as http_session:
-        if not config.VK_SERVICE_TOKEN: 
-            print("PARSER CRITICAL: VK_SERVICE_TOKEN не установлен в конфигурации! Парсинг невозможен.")
-            raise ValueError("VK_SERVICE_TOKEN не установлен.")
-        vk_api_client = AsyncVKAPI(
-            http_session, config.VK_SERVICE_TOKEN, config.VK_API_VERSION, config.VK_API_BASE_URL )
-        writer_lock = asyncio.Lock()
-        group_processing_tasks = []
-        for group_identifier in group_identifiers:
-            group_semaphore = asyncio.Semaphore(config.CONCURRENT_API_REQUESTS_PER_GROUP_SEMAPHORE)
-            processor = VKGroupProcessor(
-                vk_api_client=vk_api_client, group_identifier=group_identifier,
-                start_timestamp=start_ts, end_timestamp=end_ts, semaphore=group_semaphore,
-                posts_chunk_size=config.POSTS_CHUNK_SIZE, comments_chunk_size=config.COMMENTS_CHUNK_SIZE,
-                max_comments_per_post=config.MAX_COMMENTS_PER_POST_SESSION)
-            task = processor.process_and_write_to_file(writer_lock, output_file)
-            group_processing_tasks.append(task)
-            if len(group_identifiers) > 1: await asyncio.sleep(0.05)
-        results = await asyncio.gather(*group_processing_tasks, return_exceptions=True)
-        for i, result in enumerate(results):
-            if isinstance(result, Exception): print(f"PARSER ERROR: Ошибка при обработке группы '{group_identifiers[i]}': {result}")
-            elif isinstance(result, int): total_posts_saved_overall += result
-    print(f"\nPARSER INFO: Парсинг завершен. Всего сохранено {total_posts_saved_overall} постов в файл {output_file}.")
+        async with asyncio.TaskGroup() as task_group:
+            for group_identifier in group_identifiers:
+                task_group.create_task(_process_group(
+                    VKGroupProcessor(vk_api_client=vk_api_client, group_identifier=group_identifier,
+                                     settings=processor_settings, semaphore=admission_controller),
+                    write_queue))
+        await write_queue.put(None)
+        total_posts_saved_overall = await writer_task
+    except ExceptionGroup as eg:
+        auth_errors = eg.subgroup(VKAuthError)
+        if auth_errors is None: raise
+        logger.critical(f"Ошибка авторизации VK API, парсинг прерван: {auth_errors.exceptions[0]}")
+        raise auth_errors.exceptions[0] from None
+    finally:
+        writer_task.cancel()
+        await asyncio.wait([writer_task])
+        await f_out.close()
+    logger.info(f"Парсинг завершен. Всего сохранено {total_posts_saved_overall} постов в файл {output_file}.")
     return output_file
\ No newline at end of file
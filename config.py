@@ -6,6 +6,13 @@
 import torch
 import os
 import json
+from functools import lru_cache
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # --- БАЗОВЫЕ ПУТИ И ДИРЕКТОРИИ ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
@@ -23,6 +30,12 @@ NER_MODEL_WEIGHTS_PATH = os.path.join(MODELS_DIR, NER_MODEL_FILENAME)
 NER_LABEL_MAP_FILENAME = "ner_label_maps.json"
 NER_LABEL_MAP_PATH = os.path.join(MODELS_DIR, NER_LABEL_MAP_FILENAME)
 NER_INFERENCE_BATCH_SIZE = 32
+NER_USE_ONNX_RUNTIME = False  # требует optimum[onnxruntime] или optimum[onnxruntime-gpu]
+NER_ONNX_DIR = os.path.join(MODELS_DIR, "ner_onnx")
+QUANTIZE_NER = False  # динамическая INT8-квантизация Linear-слоев при инференсе на CPU
+NER_CACHE_ENABLED = True
+NER_CACHE_PATH = os.path.join(DATA_PROCESSED_DIR, "ner_predictions_cache.sqlite")
+NER_CACHE_MAX_ROWS = 1_000_000  # при открытии кэша сверх лимита удаляются самые старые записи
 # --- НАСТРОЙКИ TESA МОДЕЛИ ---
 TESA_MODEL_NAME_OR_PATH = "sberbank-ai/ruRoberta-large"
 TESA_MODEL_FILENAME = "best_tesa_model_sberbank-ai_ruRoberta-large.bin"
@@ -30,7 +43,18 @@ TESA_MODEL_WEIGHTS_PATH = os.path.join(MODELS_DIR, TESA_MODEL_FILENAME)
 TESA_LABEL_MAP_FILENAME = "tesa_label_maps.json"
 TESA_LABEL_MAP_PATH = os.path.join(MODELS_DIR, TESA_LABEL_MAP_FILENAME)
 TESA_INFERENCE_BATCH_SIZE = 16
+TESA_SHOW_PROGRESS = False  # прогресс-бар tqdm по батчам TESA
+TESA_USE_ONNX_RUNTIME = False  # требует optimum[onnxruntime] или optimum[onnxruntime-gpu]
+TESA_ONNX_DIR = os.path.join(MODELS_DIR, "tesa_onnx")
+TESA_USE_TORCH_COMPILE = False  # torch.compile для модели PyTorch (PyTorch >= 2.0)
+QUANTIZE_TESA = False  # динамическая INT8-квантизация Linear-слоев при инференсе на CPU
+# --- НАСТРОЙКИ ДИНАМИЧЕСКОГО БАТЧИНГА NLP ---
+NLP_MAX_BATCH_TEXTS = 2048
+NLP_MAX_BATCH_LATENCY_MS = 50
+NLP_VERBOSE_LOGGING = False  # подробные сообщения SentimentPipeline о ходе каждого запуска
+NLP_PIPELINE_CHUNK_TEXTS = 512  # размер порции текстов для конвейера NER -> TESA
 # --- ЗАГРУЗКА СЛОВАРЕЙ МЕТОК ДЛЯ МОДЕЛЕЙ ---
+@lru_cache(maxsize=8)
 def _load_json_map(path: str, map_name: str = "") -> tuple[dict[int, str], dict[str, int]]:
     """
     Вспомогательная функция для загрузки словарей 'id2label' и 'label2id' 
@@ -46,8 +70,8 @@ def _load_json_map(path: str, map_name: str = "") -> tuple[dict[int, str], dict[
     """
     id2label_map, label2id_map = {}, {}
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(path, 'rb') as f:
+            data = _json_loads(f.read())
         id2label_map = {int(k): v for k, v in data.get('id2label', {}).items()}
         label2id_map = data.get('label2id', {})
         if not id2label_map or not label2id_map:
@@ -75,9 +99,17 @@ VK_API_BASE_URL = "https://api.vk.com/method/"
 DEFAULT_GROUP_IDENTIFIERS = ["zlo43"]
 POSTS_CHUNK_SIZE = 100
 COMMENTS_CHUNK_SIZE = 100
+VK_EXECUTE_MAX_CALLS = 25  # максимум вызовов API в одном запросе execute (ограничение VK)
+VK_POSTS_WRITE_WINDOW = 250  # число постов, комментарии к которым собираются и записываются за один проход
+VK_WRITE_QUEUE_MAX_WINDOWS = 8  # сколько окон постов может ожидать записи в файл
 MAX_COMMENTS_PER_POST_SESSION = None 
 CONCURRENT_API_REQUESTS_PER_GROUP_SEMAPHORE = 4
-DELAY_AFTER_API_CALL_SECONDS = 0.37
+VK_HTTP_CONNECTION_LIMIT = 100
+VK_HTTP_CONNECTION_LIMIT_PER_HOST = 20
+VK_HTTP_DNS_CACHE_TTL_SECONDS = 300
+VK_GROUP_INFO_CACHE_TTL_SECONDS = 3600  # время жизни кэша информации о группах (groups.getById)
+VK_API_REQUESTS_PER_SECOND = 3.0  # общий для всех групп темп запросов (лимит VK для сервисного ключа)
+VK_API_BURST = 3  # сколько запросов можно отправить подряд без ожидания
 # --- НАСТРОЙКИ ОБРАБОТКИ И ХРАНЕНИЯ ДАННЫХ ---
 PARSED_DATA_OUTPUT_FILE = os.path.join(DATA_PROCESSED_DIR, "vk_parsed_data_temp.jsonl")
 NLP_RESULTS_OUTPUT_DIR = DATA_PROCESSED_DIR
@@ -1,51 +1,81 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import dateutil.tz
 import datetime
 import asyncio
+import atexit
 import sys
 import os
+import threading
+import time
+import concurrent.futures
 import json
-import copy
-from collections import Counter
-from typing import List, Dict, Any, Union, Tuple
+import re
+import functools
+import traceback
+import itertools
+from collections import Counter, defaultdict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import List, Dict, Any, Union, Tuple, Callable
 
-CURRENT_SCRIPT_DIR_UI = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT_UI = os.path.dirname(CURRENT_SCRIPT_DIR_UI)
-if PROJECT_ROOT_UI not in sys.path:
-    sys.path.insert(0, PROJECT_ROOT_UI)
+@st.cache_resource(show_spinner=False)
+def _load_backend() -> Tuple[Any, Any, Any, Any, Any]:
+    """
+    Один раз на процесс добавляет корень проекта в sys.path и импортирует
+    конфигурацию и модули бэкенда; при перезапусках скрипта возвращает их из кэша.
 
-try:
+    Returns:
+        Tuple[Any, Any, Any, Any, Any]: Модуль config, класс AnalysisService, класс AsyncVKAPI
+                                        и функции get_http_session и close_http_session парсера.
+    """
+    project_root_ui = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if project_root_ui not in sys.path:
+        sys.path.insert(0, project_root_ui)
     import config as config_module
     from backend.app_logic import AnalysisService 
-    from backend.vk_parser.parser import AsyncVKAPI 
-    import aiohttp 
-    if 'ui_module_loaded_print_once' not in st.session_state:
-        print("UI: Основные модули бэкенда и конфигурация успешно импортированы.")
-        st.session_state.ui_module_loaded_print_once = True
+    from backend.vk_parser.parser import AsyncVKAPI, get_http_session, close_http_session
+    print("UI: Основные модули бэкенда и конфигурация успешно импортированы.")
+    return config_module, AnalysisService, AsyncVKAPI, get_http_session, close_http_session
 
+try:
+    config_module, AnalysisService, AsyncVKAPI, get_vk_http_session, close_vk_http_session = _load_backend()
 except ImportError as e:
     print(f"UI: Не удалось импортировать основные бэкенд-модули: {e}. Приложение не может запуститься.")
     sys.exit(1) 
 
-def load_tesa_label_map_for_ui(config_ref: Any) -> Dict[int, str]:
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+_DEFAULT_TESA_LABELS = {0: "POS", 1: "NEG", 2: "NEU"}
+
+def sentiment_labels(tesa_labels: Dict[int, str]) -> Tuple[str, str, str]:
+    """
+    Возвращает имена меток (позитивная, негативная, нейтральная) из словаря меток TESA.
+    """
+    return tuple(tesa_labels.get(label_id, default) for label_id, default in _DEFAULT_TESA_LABELS.items())
+
+@st.cache_data(show_spinner=False, ttl=24 * 60 * 60)
+def load_tesa_label_map_for_ui(tesa_label_map_path: str) -> Dict[int, str]:
     """
-    Загружает словарь меток TESA из JSON-файла,
-    путь к которому указан в конфигурационном модуле.
+    Загружает словарь меток TESA из JSON-файла.
+    Результат кэшируется между сессиями и перезапусками скрипта (на сутки).
 
     Args:
-        config_ref (Any): Ссылка на импортированный модуль config.
+        tesa_label_map_path (str): Путь к JSON-файлу с картой меток TESA.
 
     Returns:
         Dict[int, str]: Словарь с картой меток TESA.
     """
-    if not hasattr(config_ref, 'TESA_LABEL_MAP_PATH'):
-        print("UI : TESA_LABEL_MAP_PATH не найден в config_module_ref, используется заглушка для меток.")
-        return {0: "POS", 1: "NEG", 2: "NEU"}
-    tesa_label_map_path = config_ref.TESA_LABEL_MAP_PATH
-    default_map = {0: "POS", 1: "NEG", 2: "NEU"}
+    default_map = dict(_DEFAULT_TESA_LABELS)
     try:
-        with open(tesa_label_map_path, 'r', encoding='utf-8') as f:
-            tesa_maps_json = json.load(f)
+        with open(tesa_label_map_path, 'rb') as f:
+            tesa_maps_json = _json_loads(f.read())
             id2label = {int(k): v for k, v in tesa_maps_json.get('id2label', {}).items()}
             if not id2label:
                 print(f"UI: Словарь 'id2label' не найден или пуст в файле {tesa_label_map_path}. Используется заглушка.")
@@ -58,47 +88,62 @@ def load_tesa_label_map_for_ui(config_ref: Any) -> Dict[int, str]:
         print(f"UI: Ошибка при загрузке/чтении файла словаря меток TESA {tesa_label_map_path}: {e}. Используется заглушка.")
         return default_map
 
+@st.cache_resource(show_spinner=False)
+def get_analysis_service() -> AnalysisService:
+    """
+    Создает единственный на процесс экземпляр `AnalysisService` (модели, токенизаторы, кэши),
+    общий для всех сессий и вкладок браузера.
+    """
+    service = AnalysisService()
+    print("UI INFO: AnalysisService успешно инициализирован.")
+    return service
+
 def initialize_app_state_and_services():
     """
     Инициализирует состояние сессии Streamlit необходимыми 
-    значениями по умолчанию и создает экземпляр `AnalysisService`.
-    """
-    if 'app_initialized' not in st.session_state:
-        defaults = {
-            'tesa_id2label': load_tesa_label_map_for_ui(config_module),
-            'current_group_name': "Не определена",
-            'last_group_input': getattr(config_module, 'DEFAULT_GROUP_IDENTIFIERS', [""])[0],
-            'last_processed_group_input': "", 
-            'last_processed_group_name': "Не определена",
-            'last_processed_start_date': None, 
-            'last_processed_end_date': None, 
-            'ui_start_date': max(datetime.date.today() - datetime.timedelta(days=6), datetime.date.today() - datetime.timedelta(days=365*5)),
-            'ui_end_date': datetime.date.today(),
-            'initial_summary': None,
-            'initial_detailed_mentions': None,
-            'current_summary_display': None,
-            'current_detailed_mentions_display': None,
-            'analysis_triggered_and_pending': False,
-            'multiselect_key_counter': 0,
-            'selected_entities_for_merge': [], 
-            'person_selected_for_details_dropdown': None,
-            'analysis_service_instance': None,
-            'app_initialization_error': None}
-        for key, value in defaults.items():
-            if key not in st.session_state:
-                st.session_state[key] = value        
-        try:
-            st.session_state.analysis_service_instance = AnalysisService()
-            print("UI INFO: AnalysisService успешно инициализирован.")
-        except Exception as e_init_service:
-            error_msg = f"UI КРИТИЧЕСКАЯ ОШИБКА: Не удалось инициализировать AnalysisService: {e_init_service}. Функционал анализа будет недоступен."
-            print(error_msg)
-            st.session_state.app_initialization_error = error_msg
-        st.session_state.app_initialized = True
+    значениями по умолчанию и получает общий экземпляр `AnalysisService`.
+    """
+    if 'app_initialized' in st.session_state:
+        return
+    today = datetime.date.today()
+    defaults = {
+        'tesa_id2label': load_tesa_label_map_for_ui(config_module.TESA_LABEL_MAP_PATH)
+                         if hasattr(config_module, 'TESA_LABEL_MAP_PATH') else dict(_DEFAULT_TESA_LABELS),
+        'current_group_name': "Не определена",
+        'last_group_input': getattr(config_module, 'DEFAULT_GROUP_IDENTIFIERS', [""])[0],
+        'last_processed_group_input': "", 
+        'last_processed_group_name': "Не определена",
+        'last_processed_start_date': None, 
+        'last_processed_end_date': None, 
+        'ui_start_date': today - datetime.timedelta(days=6),
+        'ui_end_date': today,
+        'analysis_view': None,
+        'analysis_triggered_and_pending': False,
+        'analysis_future': None,
+        'analysis_started_at': None,
+        'analysis_stopped': False,
+        'applied_analysis': None,
+        'selected_entities_for_merge': [], 
+        'person_selected_for_details_dropdown': None,
+        'analysis_service_instance': None,
+        'app_initialization_error': None}
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = value        
+    try:
+        st.session_state.analysis_service_instance = get_analysis_service()
+    except Exception as e_init_service:
+        error_msg = f"UI КРИТИЧЕСКАЯ ОШИБКА: Не удалось инициализировать AnalysisService: {e_init_service}. Функционал анализа будет недоступен."
+        print(error_msg)
+        st.session_state.app_initialization_error = error_msg
+    st.session_state.app_initialized = True
 
 initialize_app_state_and_services()
 
-# Вспомогательная функция (можно разместить в начале app_ui.py)
+# Схема, домен vk.com/m.vk.com и все после первого '/', '?' или '#' отбрасываются.
+_VK_IDENTIFIER_RE = re.compile(r'^(?:https?://)?(?:(?:m\.)?vk\.com/)?([^/?#]*)')
+
+@functools.lru_cache(maxsize=128)
 def clean_vk_identifier_for_api(input_str: str) -> str:
     """
     Очищает введенную строку для получения ID или короткого имени (screen_name),
@@ -106,40 +151,88 @@ def clean_vk_identifier_for_api(input_str: str) -> str:
     """
     if not input_str:
         return ""
-    cleaned_id = input_str.strip()
-    if cleaned_id.startswith("http://"):
-        cleaned_id = cleaned_id[7:]
-    elif cleaned_id.startswith("https://"):
-        cleaned_id = cleaned_id[8:]
-    if cleaned_id.startswith("vk.com/"):
-        cleaned_id = cleaned_id[7:]
-    elif cleaned_id.startswith("m.vk.com/"): 
-        cleaned_id = cleaned_id[9:]
-    if "/" in cleaned_id:
-        cleaned_id = cleaned_id.split("/")[0]
-    if "?" in cleaned_id:
-        cleaned_id = cleaned_id.split("?")[0]
-    if "#" in cleaned_id:
-        cleaned_id = cleaned_id.split("#")[0]
-    _identifier = input_str.strip()
-    if _identifier.startswith("https://"): _identifier = _identifier[8:]
-    elif _identifier.startswith("http://"): _identifier = _identifier[7:]
-    if _identifier.startswith("vk.com/"): _identifier = _identifier[7:]
-    elif _identifier.startswith("m.vk.com/"): _identifier = _identifier[9:]
-    if "/" in _identifier: _identifier = _identifier.split("/")[0]
-    if "?" in _identifier: _identifier = _identifier.split("?")[0]
-    if "#" in _identifier: _identifier = _identifier.split("#")[0]
+    _identifier = _VK_IDENTIFIER_RE.match(input_str.strip()).group(1)
     if not _identifier:
         print(f"UI WARN: Не удалось извлечь идентификатор из '{input_str}'")
         return ""
     return _identifier
 
-async def fetch_display_group_name_ui_wrapper(group_id_or_url_ui: str):
+class UIAsyncRunner:
+    """
+    Долгоживущий цикл событий в фоновом потоке для запросов UI к VK API и анализа.
+    HTTP-сессия парсера привязана к циклу событий, поэтому запросы UI и все запуски анализа
+    используют один пул соединений: TCP/TLS-соединения переиспользуются между нажатиями.
     """
-    Асинхронно получает и отображает имя группы ВКонтакте по ее ID или URL.
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="UIAsyncLoop", daemon=True).start()
+        atexit.register(self.close)
 
-    Использует AsyncVKAPI для запроса к VK API. Результат (имя группы
-    или сообщение об ошибке) сохраняется в st.session_state.current_group_name.
+    def close(self):
+        """
+        Закрывает HTTP-сессию парсера в фоновом цикле и останавливает цикл.
+        Вызывается при завершении процесса (atexit).
+        """
+        if not self.loop.is_running():
+            return
+        try:
+            self.submit(close_vk_http_session()).result(timeout=5)
+        except Exception as e:
+            print(f"UI WARNING: Не удалось закрыть HTTP-сессию VK: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """
+        Планирует корутину в фоновом цикле, не дожидаясь результата.
+        Безопасно вызывать из потоков разных сессий Streamlit.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """
+        Выполняет корутину в фоновом цикле и блокирующе ждет результат.
+        Безопасно вызывать из потоков разных сессий Streamlit.
+        """
+        return self.submit(coro).result()
+
+@st.cache_resource
+def get_ui_async_runner() -> UIAsyncRunner:
+    """ Возвращает общий для всех сессий UIAsyncRunner. """
+    return UIAsyncRunner()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _resolve_vk_group_name(identifier: str, token: str, api_version: str, base_url: str) -> Union[str, None]:
+    """
+    Запрашивает имя группы ВКонтакте через groups.getById.
+    Результат кэшируется на час по очищенному идентификатору; ошибки не кэшируются.
+
+    Args:
+        identifier (str): Очищенный ID или короткое имя группы.
+        token (str): Сервисный ключ доступа VK.
+        api_version (str): Версия VK API.
+        base_url (str): Базовый URL VK API.
+
+    Returns:
+        Union[str, None]: Имя группы или None, если группа не найдена.
+
+    Raises:
+        Exception: Сетевые ошибки и ошибки VK API пробрасываются вызывающей стороне.
+    """
+    runner = get_ui_async_runner()
+    async def _fetch_group_data():
+        vk_api_client_ui = AsyncVKAPI(session=get_vk_http_session(), token=token, api_version=api_version, api_base_url=base_url)
+        return await vk_api_client_ui.groups_getById(group_id=identifier, fields="name,screen_name")
+    group_data_list = runner.run(_fetch_group_data())
+    if group_data_list and isinstance(group_data_list, list):
+        return group_data_list[0].get("name", f"Группа '{identifier}'")
+    return None
+
+def fetch_display_group_name_ui_wrapper(group_id_or_url_ui: str):
+    """
+    Получает и отображает имя группы ВКонтакте по ее ID или URL.
+
+    Результат (имя группы или сообщение об ошибке) сохраняется
+    в st.session_state.current_group_name.
 
     Args:
         group_id_or_url_ui (str): Строка, содержащая ID, короткое имя или URL группы VK.
@@ -157,56 +250,310 @@ async def fetch_display_group_name_ui_wrapper(group_id_or_url_ui: str):
     identifier = clean_vk_identifier_for_api(group_id_or_url_ui)
     
     try:
-        async with aiohttp.ClientSession() as session: 
-            vk_api_client_ui = AsyncVKAPI(session=session, token=config_module.VK_SERVICE_TOKEN,
-                                          api_version=config_module.VK_API_VERSION, api_base_url=config_module.VK_API_BASE_URL)
-            
-            group_data_list = await vk_api_client_ui.groups_getById(group_id=identifier, fields="name,screen_name")
-            
-            if group_data_list and isinstance(group_data_list, list) and group_data_list:
-                group_info = group_data_list[0]
-                st.session_state.current_group_name = group_info.get("name", f"Группа '{identifier}'")
-                print(f"UI INFO: Имя группы '{st.session_state.current_group_name}' для ID/домена '{identifier}' получено.")
-            else:
-                st.session_state.current_group_name = f"Группа '{identifier}' не найдена или API вернул пустой ответ."
-                print(f"UI WARNING: Группа '{identifier}' не найдена или API вернул пустой результат для groups.getById.")
+        group_name = _resolve_vk_group_name(identifier, config_module.VK_SERVICE_TOKEN,
+                                            config_module.VK_API_VERSION, config_module.VK_API_BASE_URL)
+        if group_name is not None:
+            st.session_state.current_group_name = group_name
+            print(f"UI INFO: Имя группы '{st.session_state.current_group_name}' для ID/домена '{identifier}' получено.")
+        else:
+            st.session_state.current_group_name = f"Группа '{identifier}' не найдена или API вернул пустой ответ."
+            print(f"UI WARNING: Группа '{identifier}' не найдена или API вернул пустой результат для groups.getById.")
     except Exception as e:
         st.session_state.current_group_name = f"Ошибка ({type(e).__name__}) при проверке имени '{identifier}'"
         print(f"UI ERROR при проверке имени группы '{identifier}': {e}")        
 
-def load_detailed_results_from_file(filepath: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+def load_detailed_results_from_file(filepath: str) -> List[Dict[str, Any]]:
     """
     Загружает детализированные результаты анализа 
-    из указанного JSONL файла.
+    из указанного JSONL файла. Используется, только если бэкенд
+    не вернул упоминания в памяти.
 
     Args:
         filepath (str): Путь к JSONL файлу с детализированными результатами.
 
     Returns:
-        Tuple[List[Dict[str, Any]], List[str]]:
-            - detailed_mentions: Список словарей, где каждый словарь - одно упоминание.
-            - processed_group_names: Список уникальных имен групп, найденных в данных.
-            Возвращает пустые списки в случае ошибки или если файл не найден.
+        List[Dict[str, Any]]: Список словарей, где каждый словарь - одно упоминание.
+                              Пустой, если файл не найден или при ошибке чтения.
     """
-    detailed_mentions = []
-    processed_group_names = set()
+    detailed_mentions: List[Dict[str, Any]] = []
     if not filepath or not os.path.exists(filepath):
-        return detailed_mentions, list(processed_group_names)
+        return detailed_mentions
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line_number, line in enumerate(f):
+        with open(filepath, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
                 try:
-                    mention_data = json.loads(line)
-                    detailed_mentions.append(mention_data)
-                    if mention_data.get("group_name"):
-                        processed_group_names.add(mention_data["group_name"])
+                    detailed_mentions.append(_json_loads(line))
                 except json.JSONDecodeError:
-                    print(f"UI: Ошибка декодирования JSON в файле детальных результатов, строка {line_number+1}: {line.strip()}")
+                    print(f"UI: Ошибка декодирования JSON в файле детальных результатов, строка {line_number}: {line.strip().decode('utf-8', 'replace')}")
     except Exception as e:
         print(f"UI: Ошибка чтения файла детальных результатов {filepath}: {e}")
-    return detailed_mentions, list(processed_group_names)
+    return detailed_mentions
+
+class AliasedMentions(Sequence):
+    """
+    Представление упоминаний с объединенными персонами (копирование при записи):
+    исходная последовательность разделяется без копирования, а новая запись с
+    каноническим именем создается только при обращении к упоминанию объединенной персоны.
+    """
+    def __init__(self, base: Sequence, aliases: Dict[str, str]):
+        """
+        Args:
+            base (Sequence): Исходные упоминания (список или InlineMentions).
+            aliases (Dict[str, str]): Отображение "исходное имя персоны -> каноническое имя".
+        """
+        self._base = base
+        self._aliases = aliases
+
+    @classmethod
+    def merge(cls, mentions: Sequence, aliases_to_merge: List[str], canonical_name: str) -> "AliasedMentions":
+        """
+        Возвращает представление, в котором упоминания aliases_to_merge относятся к canonical_name.
+        Повторные объединения не вкладывают представления, а дополняют отображение имен.
+
+        Args:
+            mentions (Sequence): Текущие упоминания (в т.ч. AliasedMentions).
+            aliases_to_merge (List[str]): Объединяемые персоны (в текущих именах).
+            canonical_name (str): Каноническое имя.
+
+        Returns:
+            AliasedMentions: Новое представление; mentions не изменяется.
+        """
+        base, aliases = (mentions._base, mentions._aliases) if isinstance(mentions, cls) else (mentions, {})
+        alias_set = frozenset(aliases_to_merge)
+        new_aliases = {source: (canonical_name if target in alias_set else target) for source, target in aliases.items()}
+        for alias in alias_set:
+            new_aliases.setdefault(alias, canonical_name)
+        return cls(base, {source: target for source, target in new_aliases.items() if source != target})
+
+    def __len__(self) -> int:
+        return len(self._base)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        mention = self._base[i]
+        canonical_name = self._aliases.get(mention.get("entity_normalized"))
+        return mention if canonical_name is None else {**mention, "entity_normalized": canonical_name}
+
+    def entity_names(self) -> List[str]:
+        """ Имена персон всех упоминаний с учетом объединений. """
+        return [self._aliases.get(name, name) for name in mention_entity_names(self._base)]
+
+class InlineMentions(Sequence):
+    """
+    Детализированные упоминания, полученные от бэкенда в памяти (записи Mention):
+    файл результатов не читается, словарь создается при обращении к упоминанию.
+    """
+    def __init__(self, records: Sequence):
+        """
+        Args:
+            records (Sequence): Записи Mention из результата AnalysisService.run_full_analysis.
+        """
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._records[i]._asdict()
+
+    def entity_names(self) -> List[str]:
+        """ Имена персон (entity_normalized) всех упоминаний. """
+        return [record.entity_normalized for record in self._records]
+
+def mention_entity_names(mentions: Sequence) -> List[str]:
+    """
+    Возвращает имена персон (entity_normalized) всех упоминаний.
+    Для InlineMentions и AliasedMentions имена берутся без создания словарей упоминаний.
+    """
+    if isinstance(mentions, (InlineMentions, AliasedMentions)):
+        return mentions.entity_names()
+    return [mention.get("entity_normalized", "") for mention in mentions]
+
+def freeze_analysis_data(value: Any) -> Any:
+    """
+    Рекурсивно заменяет словари на MappingProxyType, а списки на кортежи.
+    Результат анализа разделяется между сессиями, а внутри сессии - между исходным
+    снимком и текущим представлением, поэтому изменение его на месте исключается:
+    объединение персон создает новый словарь верхнего уровня и разделяет неизмененные ветви.
+
+    Args:
+        value (Any): Данные анализа (сводка).
+
+    Returns:
+        Any: Неизменяемое представление данных.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze_analysis_data(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_analysis_data(item) for item in value)
+    return value
+
+@dataclass(frozen=True, slots=True)
+class AnalysisView:
+    """
+    Результат анализа в состоянии сессии: исходные сводка и упоминания (для сброса объединений)
+    и текущее представление с учетом объединений персон. Объект неизменяемый и заменяется
+    целиком (dataclasses.replace), поэтому исходные и текущие данные разделяются по ссылке.
+    """
+    initial_summary: Mapping[str, Any]
+    initial_mentions: Sequence
+    current_summary: Mapping[str, Any]
+    current_mentions: Sequence
+
+    @classmethod
+    def of(cls, summary: Mapping[str, Any], mentions: Sequence) -> "AnalysisView":
+        """ Представление нового результата анализа (без объединений). """
+        return cls(initial_summary=summary, initial_mentions=mentions, current_summary=summary, current_mentions=mentions)
+
+    def without_merges(self) -> "AnalysisView":
+        """ Представление с отмененными объединениями персон. """
+        return replace(self, current_summary=self.initial_summary, current_mentions=self.initial_mentions)
+
+class AnalysisJobs:
+    """
+    Общий для всех сессий реестр запусков анализа в фоновом цикле событий UIAsyncRunner.
+    Запуски с одинаковыми параметрами (группы, начальная и конечная даты) разделяют один
+    Future: повторный запуск, в т.ч. из другой вкладки, пока анализ еще идет, не выполняет
+    анализ заново. Успешный результат переиспользуется в течение ttl_seconds; ошибки,
+    отмененные запуски и результаты без упоминаний в памяти, файл упоминаний которых удален,
+    не переиспользуются. Для идущих запусков считается число ожидающих их сессий: запуск
+    отменяется, только когда от него отказалась последняя из них.
+    """
+    def __init__(self, runner: UIAsyncRunner, ttl_seconds: float, max_entries: int):
+        """
+        Args:
+            runner (UIAsyncRunner): Фоновый цикл событий, в котором выполняется анализ.
+            ttl_seconds (float): Время (с) от запуска, в течение которого результат переиспользуется.
+            max_entries (int): Сколько завершенных запусков хранить.
+        """
+        self._runner = runner
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._jobs: Dict[Tuple[str, str, str], Tuple[float, concurrent.futures.Future]] = {}
+        self._holders: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, service: AnalysisService, group_identifiers_str: str,
+               date_start_str: str, date_end_str: str) -> concurrent.futures.Future:
+        """
+        Запускает AnalysisService.run_full_analysis в фоне или возвращает подходящий текущий запуск.
+
+        Args:
+            service (AnalysisService): Сервис анализа.
+            group_identifiers_str (str): ID или короткие имена групп через запятую.
+            date_start_str (str): Начальная дата периода ('%Y-%m-%d').
+            date_end_str (str): Конечная дата периода ('%Y-%m-%d').
+
+        Returns:
+            concurrent.futures.Future: Future с результатом AnalysisService.run_full_analysis.
+        """
+        key = (group_identifiers_str, date_start_str, date_end_str)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and self._is_reusable(*job):
+                print(f"UI INFO: Используется текущий или недавний запуск анализа для {key}.")
+                if not job[1].done():
+                    self._holders[key] = self._holders.get(key, 0) + 1
+                return job[1]
+            analysis_future = self._runner.submit(self._run_analysis(
+                service, group_identifiers_str, date_start_str, date_end_str))
+            self._jobs.pop(key, None)
+            self._jobs[key] = (time.monotonic(), analysis_future)
+            self._holders[key] = 1
+            excess = len(self._jobs) - self._max_entries
+            if excess > 0:
+                finished_keys = [job_key for job_key, (_, job_future) in self._jobs.items() if job_future.done()]
+                for job_key in finished_keys[:excess]:
+                    del self._jobs[job_key]
+                    self._holders.pop(job_key, None)
+            return analysis_future
+
+    def release(self, analysis_future: concurrent.futures.Future) -> None:
+        """
+        Снимает ожидание запуска одной сессией. Запуск отменяется, только если
+        его больше не ожидает ни одна сессия.
+
+        Args:
+            analysis_future (concurrent.futures.Future): Future, полученный из submit.
+        """
+        with self._lock:
+            job_key = next((key for key, (_, job_future) in self._jobs.items() if job_future is analysis_future), None)
+            if job_key is None or analysis_future.done():
+                return
+            holders = self._holders.get(job_key, 1) - 1
+            if holders > 0:
+                self._holders[job_key] = holders
+                print(f"UI INFO: Сессия отказалась от запуска анализа {job_key}; ожидающих сессий осталось: {holders}.")
+                return
+            self._holders.pop(job_key, None)
+        analysis_future.cancel()
+
+    @staticmethod
+    async def _run_analysis(service: AnalysisService, group_identifiers_str: str,
+                            date_start_str: str, date_end_str: str) -> Dict[str, Any]:
+        """
+        Выполняет анализ и замораживает сводку в фоновом цикле, а не в потоке скрипта:
+        замороженную сводку разделяют все сессии, получившие этот запуск.
+        """
+        analysis_results = await service.run_full_analysis(
+            group_identifiers_str=group_identifiers_str, date_start_str=date_start_str, date_end_str=date_end_str)
+        if analysis_results.get("summary") is not None:
+            analysis_results["summary"] = freeze_analysis_data(analysis_results["summary"])
+        return analysis_results
+
+    def _is_reusable(self, started_at: float, analysis_future: concurrent.futures.Future) -> bool:
+        if not analysis_future.done():
+            return True
+        if analysis_future.cancelled() or analysis_future.exception() is not None:
+            return False
+        analysis_results = analysis_future.result()
+        if "error" in analysis_results or time.monotonic() - started_at > self._ttl_seconds:
+            return False
+        if analysis_results.get("detailed_mentions") is not None:
+            return True
+        detailed_file = analysis_results.get("detailed_results_file")
+        return not detailed_file or os.path.exists(detailed_file)
+
+@st.cache_resource
+def get_analysis_jobs() -> AnalysisJobs:
+    """ Возвращает общий для всех сессий реестр запусков анализа. """
+    return AnalysisJobs(get_ui_async_runner(), ttl_seconds=3600, max_entries=16)
 
 # --- Функции для рендеринга компонентов пользовательского интерфейса ---
+_START_DATE_WIDGET_KEY = "start_date_widget_sidebar_key_v5"
+_END_DATE_WIDGET_KEY = "end_date_widget_sidebar_key_v5"
+
+def update_start_date_callback():
+    """
+    Колбэк-функция для виджета начальной даты.
+    Обновляет st.session_state.ui_start_date и удерживает конечную дату в пределах
+    [начальная дата, начальная дата + 365 дней], но не позже сегодняшнего дня.
+    """
+    today = datetime.date.today()
+    start_date = st.session_state[_START_DATE_WIDGET_KEY]
+    st.session_state.ui_start_date = start_date
+    end_date = st.session_state.ui_end_date
+    if end_date < start_date:
+        end_date = start_date
+    elif (end_date - start_date).days > 365:
+        end_date = min(start_date + datetime.timedelta(days=365), today)
+    if end_date != st.session_state.ui_end_date:
+        st.session_state.ui_end_date = end_date
+        # Виджет конечной даты пересоздается со значением ui_end_date.
+        st.session_state.pop(_END_DATE_WIDGET_KEY, None)
+
+def update_end_date_callback():
+    """
+    Колбэк-функция для виджета конечной даты.
+    Обновляет st.session_state.ui_end_date.
+    """
+    st.session_state.ui_end_date = st.session_state[_END_DATE_WIDGET_KEY]
+
 def render_sidebar():
     """
     Отрисовывает боковую панель с элементами управления
@@ -228,7 +575,7 @@ def render_sidebar():
             st.session_state.last_group_input = group_url_or_id_input_val        
         if st.button("Проверить имя группы", key="check_group_name_button_sidebar_key_v5"):
             if st.session_state.last_group_input:
-                asyncio.run(fetch_display_group_name_ui_wrapper(st.session_state.last_group_input))
+                fetch_display_group_name_ui_wrapper(st.session_state.last_group_input)
                 st.rerun()
         if st.session_state.current_group_name and st.session_state.current_group_name != "Не определена":
             st.caption(f"Выбранная группа: **{st.session_state.current_group_name}**")
@@ -240,24 +587,14 @@ def render_sidebar():
         st.markdown("## **Период анализа**")
         today = datetime.date.today()        
         five_years_ago = today - datetime.timedelta(days=365 * 5)         
-        start_date_selected = st.date_input( 
+        st.date_input( 
             "Начальная дата:", value=st.session_state.ui_start_date,
-            min_value=five_years_ago, max_value=today, key="start_date_widget_sidebar_key_v5")
-        if start_date_selected != st.session_state.ui_start_date:
-            st.session_state.ui_start_date = start_date_selected
-            if st.session_state.ui_end_date < st.session_state.ui_start_date:
-                st.session_state.ui_end_date = st.session_state.ui_start_date
-            if (st.session_state.ui_end_date - st.session_state.ui_start_date).days > 365: 
-                st.session_state.ui_end_date = st.session_state.ui_start_date + datetime.timedelta(days=365)
-                if st.session_state.ui_end_date > today: st.session_state.ui_end_date = today
-            st.rerun()
+            min_value=five_years_ago, max_value=today, key=_START_DATE_WIDGET_KEY, on_change=update_start_date_callback)
         actual_max_end_date_for_widget = min(today, st.session_state.ui_start_date + datetime.timedelta(days=365))
-        end_date_selected = st.date_input( 
+        st.date_input( 
             "Конечная дата:", value=st.session_state.ui_end_date,
-            min_value=st.session_state.ui_start_date, max_value=actual_max_end_date_for_widget, key="end_date_widget_sidebar_key_v5")
-        if end_date_selected != st.session_state.ui_end_date:
-            st.session_state.ui_end_date = end_date_selected
-            st.rerun()        
+            min_value=st.session_state.ui_start_date, max_value=actual_max_end_date_for_widget,
+            key=_END_DATE_WIDGET_KEY, on_change=update_end_date_callback)
         period_is_invalid = (st.session_state.ui_end_date - st.session_state.ui_start_date).days > 365 or \
                             st.session_state.ui_start_date > st.session_state.ui_end_date
         if (st.session_state.ui_end_date - st.session_state.ui_start_date).days > 365:
@@ -273,13 +610,10 @@ def render_sidebar():
             if not analysis_possible:
                 st.warning("Пожалуйста, введите корректный ID группы, проверьте имя и убедитесь, что нет ошибок инициализации.")
             else:
-                st.session_state.current_summary_display = None
-                st.session_state.current_detailed_mentions_display = None
-                st.session_state.initial_summary = None
+                st.session_state.analysis_view = None
                 st.session_state.analysis_triggered_and_pending = True
-                st.session_state.selected_entities_for_merge = []
-                st.session_state.multiselect_key_counter += 1
                 st.session_state.person_selected_for_details_dropdown = None
+                reset_entity_widgets_state()
                 raw_group_input_from_state = st.session_state.last_group_input 
                 cleaned_group_id_for_processing = clean_vk_identifier_for_api(raw_group_input_from_state)
                 st.session_state.last_processed_group_input = cleaned_group_id_for_processing
@@ -288,55 +622,121 @@ def render_sidebar():
                 st.session_state.last_processed_end_date = st.session_state.ui_end_date
                 st.rerun() 
                 
+@st.fragment(run_every=1.0)
+def render_analysis_progress():
+    """
+    Отображает ход фонового анализа и раз в секунду проверяет его завершение,
+    перезапуская только этот фрагмент. После завершения анализа перезапускает
+    весь скрипт, чтобы обработать и отрисовать результаты.
+    """
+    analysis_future = st.session_state.analysis_future
+    if analysis_future is None or analysis_future.done():
+        st.rerun()
+    if st.session_state.last_processed_group_name != "Не определена":
+        st.header(f"Обработка группы: {st.session_state.last_processed_group_name}")
+        if st.session_state.last_processed_start_date and st.session_state.last_processed_end_date:
+            st.subheader(f"Период: {st.session_state.last_processed_start_date.strftime('%d.%m.%Y')} - {st.session_state.last_processed_end_date.strftime('%d.%m.%Y')}")
+        st.markdown("---")
+    elapsed_seconds = int(time.monotonic() - st.session_state.analysis_started_at)
+    st.info(f"Идет анализ группы '{st.session_state.last_processed_group_name}' "
+            f"(ID/домен: {st.session_state.last_processed_group_input})... Прошло {elapsed_seconds} с.")
+    if st.button("Остановить анализ", key="cancel_analysis_btn_v5"):
+        # Запуск может быть общим с другими сессиями: сессия только отказывается от него,
+        # а отменяет его AnalysisJobs, если больше никто не ждет результата.
+        st.session_state.analysis_future = None
+        st.session_state.analysis_stopped = True
+        get_analysis_jobs().release(analysis_future)
+        st.rerun()
+
 def render_report_header():
     """
     Отрисовывает заголовок отчета в основной области UI,
     если анализ был проведен и есть данные для отображения.
     Включает имя группы, период анализа и общее количество найденных персон.
     """
-    if st.session_state.last_processed_group_name != "Не определена" and st.session_state.current_summary_display is not None:
+    analysis_view = st.session_state.analysis_view
+    if st.session_state.last_processed_group_name != "Не определена" and analysis_view is not None:
         st.header(f"Отчет по группе: {st.session_state.last_processed_group_name}")
         if st.session_state.last_processed_start_date and st.session_state.last_processed_end_date:
             st.subheader(f"Период: {st.session_state.last_processed_start_date.strftime('%d.%m.%Y')} - {st.session_state.last_processed_end_date.strftime('%d.%m.%Y')}")
-        total_unique_persons = len(st.session_state.current_summary_display.keys())
+        total_unique_persons = len(analysis_view.current_summary)
         st.success(f"### **Найдено мнений о {total_unique_persons} уникальных персонах**") 
         st.markdown("---")
 
-def render_top10_summary(summary_data: Dict[str, Any], tesa_labels: Dict[int, str]):
+def memoize_for_object(state_key: str, source: Any, build: Callable[[Any], Any]) -> Any:
+    """
+    Возвращает build(source), пересчитывая значение только при смене объекта source.
+    Значение хранится в состоянии сессии вместе со ссылкой на source: данные анализа
+    не изменяются на месте (объединение и сброс подменяют объект целиком),
+    поэтому проверки идентичности достаточно.
+
+    Args:
+        state_key (str): Ключ в st.session_state для хранения значения.
+        source (Any): Объект, от которого зависит значение.
+        build (Callable[[Any], Any]): Функция вычисления значения по source.
+
+    Returns:
+        Any: Значение build(source).
+    """
+    cached = st.session_state.get(state_key)
+    if cached is None or cached[0] is not source:
+        cached = (source, build(source))
+        st.session_state[state_key] = cached
+    return cached[1]
+
+def summary_to_person_totals_df(summary_data: Dict[str, Any], tesa_labels: Dict[int, str]) -> pd.DataFrame:
+    """
+    Сводит агрегированные данные summary_data[персона][дата][метка] в таблицу
+    с суммарным числом упоминаний по каждой персоне (один проход, без промежуточных словарей строк).
+
+    Args:
+        summary_data (Dict[str, Any]): Агрегированные данные анализа.
+        tesa_labels (Dict[int, str]): Словарь меток тональности.
+
+    Returns:
+        pd.DataFrame: Таблица с индексом "Персона" (в порядке summary_data) и столбцами
+                      "Всего упоминаний", "Позитивных", "Негативных", "Нейтральных".
+    """
+    pos_label, neg_label, neu_label = sentiment_labels(tesa_labels)
+    totals_arr = np.zeros((len(summary_data), 3), dtype=np.int64)
+    for row, date_data in enumerate(summary_data.values()):
+        person_totals = Counter()
+        for counts in date_data.values(): person_totals.update(counts)
+        totals_arr[row] = (person_totals[pos_label], person_totals[neg_label], person_totals[neu_label])
+    df_totals = pd.DataFrame(totals_arr, index=pd.Index(list(summary_data), name="Персона"),
+                             columns=["Позитивных", "Негативных", "Нейтральных"])
+    df_totals.insert(0, "Всего упоминаний", totals_arr.sum(axis=1))
+    return df_totals
+
+def render_top10_summary(person_totals_df: pd.DataFrame):
     """
     Отрисовывает секцию с топ упоминаемыми персонами.
 
     Args:
-        summary_data (Dict[str, Any]): Агрегированные данные анализа 
-                                       (ключ 'summary_by_entity_date' из ответа сервиса).
-        tesa_labels (Dict[int, str]): Словарь для сопоставления ID меток тональности с их именами.
+        person_totals_df (pd.DataFrame): Суммы упоминаний по персонам (см. summary_to_person_totals_df).
     """
-    if not summary_data: st.write("Нет данных для отображения топа."); return
+    if person_totals_df.empty: st.write("Нет данных для отображения топа."); return
     st.subheader("Топ-10 упоминаемых персон и их тональность")
-    entity_total_counts = Counter()
-    person_sentiment_overall = {}
-    pos_label = tesa_labels.get(0, "POS"); neg_label = tesa_labels.get(1, "NEG"); neu_label = tesa_labels.get(2, "NEU")
-    for person, date_data in summary_data.items():
-        pos, neg, neu = 0,0,0
-        for _, counts in date_data.items(): pos += counts.get(pos_label,0); neg += counts.get(neg_label,0); neu += counts.get(neu_label,0)
-        entity_total_counts[person] = pos + neg + neu
-        person_sentiment_overall[person] = {pos_label:pos, neg_label:neg, neu_label:neu}    
     top_n = 10 
-    if not entity_total_counts: st.write("Данные для топа персон отсутствуют."); return
-    most_common_persons = entity_total_counts.most_common(top_n)
-    df_top_persons_data = [{"Персона": p, "Всего упоминаний": tc,
-                            "Позитивных": person_sentiment_overall.get(p,{}).get(pos_label,0),
-                            "Негативных": person_sentiment_overall.get(p,{}).get(neg_label,0),
-                            "Нейтральных": person_sentiment_overall.get(p,{}).get(neu_label,0)} 
-                           for p, tc in most_common_persons]
-    df_top = pd.DataFrame(df_top_persons_data).set_index("Персона")
+    df_top = memoize_for_object('top10_df', person_totals_df, lambda df: df.nlargest(top_n, "Всего упоминаний", keep="first"))
     if not df_top.empty:
         st.dataframe(df_top, use_container_width=True)
         st.markdown("#### Общее количество упоминаний (Топ-10)")
         st.bar_chart(df_top[["Всего упоминаний"]], height=300)
         st.markdown("#### Распределение тональностей (Топ-10)")
         st.bar_chart(df_top[["Позитивных", "Негативных", "Нейтральных"]], height=400)
-_multiselect_key_for_callback = ""
+_MERGE_MULTISELECT_KEY = "entities_multiselect_key_v5"
+_DETAILS_SELECTBOX_KEY = "person_details_selectbox_v5"
+
+def reset_entity_widgets_state():
+    """
+    Сбрасывает выбор персон для объединения и состояние виджетов, зависящих от списка персон.
+    При следующем запуске скрипта виджеты создаются заново со значениями из st.session_state
+    (ключи виджетов постоянны, поэтому они не пересоздаются без необходимости).
+    """
+    st.session_state.selected_entities_for_merge = []
+    st.session_state.pop(_MERGE_MULTISELECT_KEY, None)
+    st.session_state.pop(_DETAILS_SELECTBOX_KEY, None)
 
 def update_multiselect_selection_callback():
     """
@@ -344,8 +744,8 @@ def update_multiselect_selection_callback():
     Обновляет st.session_state.selected_entities_for_merge текущим выбором
     пользователя из виджета st.multiselect.
     """
-    if _multiselect_key_for_callback in st.session_state:
-        st.session_state.selected_entities_for_merge = st.session_state[_multiselect_key_for_callback]
+    if _MERGE_MULTISELECT_KEY in st.session_state:
+        st.session_state.selected_entities_for_merge = st.session_state[_MERGE_MULTISELECT_KEY]
         
 def update_selectbox_details_callback(selectbox_key: str):
     """
@@ -361,8 +761,7 @@ def update_selectbox_details_callback(selectbox_key: str):
         st.session_state.person_selected_for_details_dropdown = selected_value if selected_value else None 
 
 def render_main_report_table_and_merge(summary_data: Dict[str, Any], 
-                                       detailed_mentions_data: List[Dict[str, Any]], 
-                                       tesa_labels: Dict[int, str], 
+                                       person_totals_df: pd.DataFrame,
                                        service_instance: Union[AnalysisService, None]):
     """
     Отрисовывает сводную таблицу со всеми найденными персонами
@@ -370,45 +769,38 @@ def render_main_report_table_and_merge(summary_data: Dict[str, Any],
 
     Args:
         summary_data (Dict[str, Any]): Агрегированные данные анализа.
-        detailed_mentions_data (List[Dict[str, Any]]): Список детализированных упоминаний.
-        tesa_labels (Dict[int, str]): Словарь меток тональности.
+        person_totals_df (pd.DataFrame): Суммы упоминаний по персонам (см. summary_to_person_totals_df).
         service_instance (Union[AnalysisService, None]): Экземпляр сервиса анализа
                                                          для выполнения операции объединения.
                                                          Если None, функция объединения будет недоступна.
     """
-    global _multiselect_key_for_callback 
     if not summary_data: st.write("Нет данных для основного отчета."); return    
     st.markdown("---"); st.subheader("🔎 Сводная таблица и объединение персон")
     search_query = st.text_input("Поиск по персонам в таблице:", key="entity_search_main_table_key_v5")
-    summary_table_data_for_df = []
-    pos_label = tesa_labels.get(0, "POS"); neg_label = tesa_labels.get(1, "NEG"); neu_label = tesa_labels.get(2, "NEU")
-    for person, date_data_map in summary_data.items():
-        total_mentions, pos, neg, neu = 0,0,0,0
-        for counts in date_data_map.values():
-            p_c = counts.get(pos_label,0); n_c = counts.get(neg_label,0); u_c = counts.get(neu_label,0)
-            pos+=p_c; neg+=n_c; neu+=u_c; total_mentions+=(p_c+n_c+u_c)
-        summary_table_data_for_df.append({"Персона":person, "Всего упоминаний":total_mentions, "Позитивных":pos, "Негативных":neg, "Нейтральных":neu})    
-    if not summary_table_data_for_df: st.write("Нет данных для таблицы."); return
-    df_full = pd.DataFrame(summary_table_data_for_df).sort_values(by="Всего упоминаний", ascending=False).reset_index(drop=True)
-    df_display = df_full[df_full["Персона"].str.contains(search_query, case=False, na=False)] if search_query else df_full
-    st.dataframe(df_display.set_index("Персона"), height=400, use_container_width=True)
+    if person_totals_df.empty: st.write("Нет данных для таблицы."); return
+    df_full = memoize_for_object(
+        'summary_table_sorted', summary_data,
+        lambda _: person_totals_df.sort_values(by="Всего упоминаний", ascending=False))
+    if search_query:
+        # Поиск по подстроке без регулярных выражений; имена в нижнем регистре вычисляются один раз на таблицу.
+        persons_lower = memoize_for_object('summary_table_persons_lower', df_full, lambda df: df.index.str.lower())
+        df_display = df_full[np.asarray(persons_lower.str.contains(search_query.lower(), regex=False, na=False), dtype=bool)]
+    else:
+        df_display = df_full
+    st.dataframe(df_display, height=400, use_container_width=True)
     st.markdown("---"); st.markdown("### Объединение персон")
-    options = df_display["Персона"].tolist()    
-    _multiselect_key_for_callback = f"entities_multiselect_key_v5_{st.session_state.multiselect_key_counter}" 
+    options = df_display.index.tolist()    
     valid_current_selection = [s for s in st.session_state.selected_entities_for_merge if s in options]     
     st.multiselect("Выберите персоны для объединения (>1):", 
                    options=options, default=valid_current_selection, 
-                   key=_multiselect_key_for_callback, on_change=update_multiselect_selection_callback)
-    if st.session_state.initial_summary is not None:
-        if st.button("Сбросить все объединения", key="reset_btn_v5_global"):
-            st.session_state.current_summary_display = copy.deepcopy(st.session_state.initial_summary)
-            st.session_state.current_detailed_mentions_display = copy.deepcopy(st.session_state.initial_detailed_mentions or [])
-            st.session_state.selected_entities_for_merge = [] 
-            st.session_state.multiselect_key_counter +=1     
-            if st.session_state.person_selected_for_details_dropdown and \
-               st.session_state.person_selected_for_details_dropdown not in st.session_state.current_summary_display:
-                st.session_state.person_selected_for_details_dropdown = None
-            st.info("Объединения сброшены."); st.rerun()
+                   key=_MERGE_MULTISELECT_KEY, on_change=update_multiselect_selection_callback)
+    if st.button("Сбросить все объединения", key="reset_btn_v5_global"):
+        st.session_state.analysis_view = st.session_state.analysis_view.without_merges()
+        reset_entity_widgets_state()
+        if st.session_state.person_selected_for_details_dropdown and \
+           st.session_state.person_selected_for_details_dropdown not in st.session_state.analysis_view.current_summary:
+            st.session_state.person_selected_for_details_dropdown = None
+        st.info("Объединения сброшены."); st.rerun()
 
     if len(st.session_state.selected_entities_for_merge) > 1:
         canon_name = st.text_input("Каноническое имя:", 
@@ -416,38 +808,106 @@ def render_main_report_table_and_merge(summary_data: Dict[str, Any],
                                    key="canon_name_input_v5") 
         if st.button("Объединить выбранные", key="merge_btn_v5", type="primary"):
             if canon_name.strip() and service_instance:
-                new_sum, new_det = service_instance.reaggregate_with_aliases(
-                    st.session_state.current_summary_display,
-                    st.session_state.current_detailed_mentions_display or [],
-                    st.session_state.selected_entities_for_merge, canon_name.strip())
-                st.session_state.current_summary_display = new_sum
-                st.session_state.current_detailed_mentions_display = new_det
-                st.session_state.selected_entities_for_merge = [] 
-                st.session_state.multiselect_key_counter +=1 
+                aliases_to_merge, canonical_name = st.session_state.selected_entities_for_merge, canon_name.strip()
+                analysis_view = st.session_state.analysis_view
+                new_det = AliasedMentions.merge(analysis_view.current_mentions, aliases_to_merge, canonical_name)
+                carry_mentions_index_over_merge(analysis_view.current_mentions, new_det, aliases_to_merge, canonical_name)
+                st.session_state.analysis_view = replace(
+                    analysis_view, current_mentions=new_det,
+                    current_summary=service_instance.merge_summary_aliases(analysis_view.current_summary, aliases_to_merge, canonical_name))
                 if st.session_state.person_selected_for_details_dropdown and \
                    (st.session_state.person_selected_for_details_dropdown in st.session_state.selected_entities_for_merge or \
-                    st.session_state.person_selected_for_details_dropdown not in st.session_state.current_summary_display):
+                    st.session_state.person_selected_for_details_dropdown not in st.session_state.analysis_view.current_summary):
                      st.session_state.person_selected_for_details_dropdown = None                
+                reset_entity_widgets_state()
                 st.rerun()
             elif not service_instance:
                  st.error("Сервис анализа не доступен для объединения.")
             else: st.warning("Укажите каноническое имя.")
 
+def _build_mentions_index_by_entity(mentions: Sequence) -> Dict[str, List[int]]:
+    """ Строит индекс "персона -> позиции упоминаний" за один проход по упоминаниям. """
+    index_by_entity = defaultdict(list)
+    for i, entity_name in enumerate(mention_entity_names(mentions)):
+        index_by_entity[entity_name].append(i)
+    return dict(index_by_entity)
+
+def get_mentions_index_by_entity(mentions: Sequence) -> Dict[str, List[int]]:
+    """
+    Возвращает индекс "персона -> позиции упоминаний" для списка упоминаний.
+    Индекс перестраивается только при смене списка (новый анализ, объединение или сброс объединений).
+
+    Args:
+        mentions (Sequence): Последовательность детализированных упоминаний (список или InlineMentions).
+
+    Returns:
+        Dict[str, List[int]]: Позиции упоминаний в списке для каждой персоны.
+    """
+    return memoize_for_object('mentions_index_by_entity', mentions, _build_mentions_index_by_entity)
+
+def carry_mentions_index_over_merge(old_mentions: Sequence, new_mentions: Sequence,
+                                    aliases_to_merge: List[str], canonical_name: str):
+    """
+    Переносит построенный индекс упоминаний на представление после объединения персон:
+    позиции упоминаний не меняются, поэтому достаточно слить списки позиций алиасов,
+    не разбирая все упоминания заново.
+
+    Args:
+        old_mentions (Sequence): Упоминания до объединения.
+        new_mentions (Sequence): Упоминания после объединения (AliasedMentions над old_mentions).
+        aliases_to_merge (List[str]): Объединенные персоны.
+        canonical_name (str): Каноническое имя.
+    """
+    cached = st.session_state.get('mentions_index_by_entity')
+    if cached is None or cached[0] is not old_mentions:
+        return
+    index_by_entity = dict(cached[1])
+    positions = index_by_entity.pop(canonical_name, [])
+    for alias in set(aliases_to_merge) - {canonical_name}:
+        positions = positions + index_by_entity.pop(alias, [])
+    if positions:
+        index_by_entity[canonical_name] = sorted(positions)
+    st.session_state['mentions_index_by_entity'] = (new_mentions, index_by_entity)
+
+_MENTIONS_PAGE_SIZE_MAX = 100  # максимум текстов упоминаний на одной странице деталей персоны
+_MAX_FORMATTABLE_TIMESTAMP = 253402300799  # 9999-12-31 23:59:59 UTC - предел datetime
+
+def format_mention_timestamps(mentions: List[Dict[str, Any]]) -> List[str]:
+    """
+    Форматирует метки времени упоминаний (локальное время сервера) одним векторизованным вызовом.
+
+    Args:
+        mentions (List[Dict[str, Any]]): Отображаемые упоминания.
+
+    Returns:
+        List[str]: Дата для каждого упоминания в формате '%Y-%m-%d %H:%M',
+                   "N/A" при отсутствии метки или "<метка> (ошибка формата)".
+    """
+    raw_timestamps = [m.get('timestamp') for m in mentions]
+    numeric_timestamps = pd.to_numeric(pd.Series(raw_timestamps, dtype=object), errors='coerce')
+    numeric_timestamps = numeric_timestamps.where(numeric_timestamps.abs() < _MAX_FORMATTABLE_TIMESTAMP)
+    formatted = (pd.to_datetime(numeric_timestamps, unit='s', utc=True, errors='coerce')
+                 .dt.tz_convert(dateutil.tz.tzlocal()).dt.strftime('%Y-%m-%d %H:%M'))
+    return ["N/A" if not ts else (f"{ts} (ошибка формата)" if pd.isna(date_str) else date_str)
+            for ts, date_str in zip(raw_timestamps, formatted)]
+
+@st.fragment
 def render_person_details_expander(summary_data: Dict[str, Any], 
-                                   detailed_mentions_data: List[Dict[str, Any]], 
+                                   detailed_mentions_data: Sequence, 
                                    tesa_labels: Dict[int, str]):
     """
     Отрисовывает секцию для детального просмотра информации по выбранной персоне.
+    Секция - фрагмент Streamlit: выбор персоны, размера и номера страницы перезапускает
+    только ее, не пересчитывая сводные таблицы и таблицу объединения.
 
     Args:
         summary_data (Dict[str, Any]): Агрегированные данные анализа.
-        detailed_mentions_data (List[Dict[str, Any]]): Список детализированных упоминаний.
+        detailed_mentions_data (Sequence): Детализированные упоминания (список или InlineMentions).
         tesa_labels (Dict[int, str]): Словарь меток тональности.
     """
     if not summary_data or len(summary_data) == 0: return 
     st.markdown("---"); st.subheader("📜 Детальный анализ персоны")        
-    person_options = [""] + sorted(list(summary_data.keys())) 
-    selectbox_key = f"person_details_selectbox_v5_{st.session_state.multiselect_key_counter}" 
+    person_options = memoize_for_object('person_options_sorted', summary_data, lambda data: [""] + sorted(data))
     current_person_for_details = st.session_state.person_selected_for_details_dropdown
     if current_person_for_details not in person_options:
         current_person_for_details = "" 
@@ -456,50 +916,57 @@ def render_person_details_expander(summary_data: Dict[str, Any],
     st.selectbox("Выберите персону для просмотра деталей:", 
                  options=person_options, 
                  index=person_options.index(current_person_for_details) if current_person_for_details in person_options else 0,
-                 key=selectbox_key,
+                 key=_DETAILS_SELECTBOX_KEY,
                  on_change=update_selectbox_details_callback,
-                 args=(selectbox_key,))     
+                 args=(_DETAILS_SELECTBOX_KEY,))     
     if st.session_state.person_selected_for_details_dropdown:
         person_to_show = st.session_state.person_selected_for_details_dropdown
         with st.expander(f"Детали по персоне: {person_to_show}", expanded=True):
             st.markdown(f"### Динамика упоминаний для: {person_to_show}")
             person_s_data = summary_data.get(person_to_show,{})
             if person_s_data:
-                dates, pos_c, neg_c, neu_c = [],[],[],[]
-                pos_label = tesa_labels.get(0, "POS"); neg_label = tesa_labels.get(1, "NEG"); neu_label = tesa_labels.get(2, "NEU")
-                for date_str, counts in sorted(person_s_data.items()): 
-                    try:
-                        dates.append(pd.to_datetime(date_str).date()) 
-                        pos_c.append(counts.get(pos_label,0)); neg_c.append(counts.get(neg_label,0)); neu_c.append(counts.get(neu_label,0))
-                    except Exception as e_date_conv: 
-                        print(f"UI WARNING: Ошибка преобразования даты '{date_str}' для графика персоны '{person_to_show}': {e_date_conv}")
-                        pass 
-                if dates:
-                    df_dyn = pd.DataFrame({'Дата':dates, pos_label:pos_c, neg_label:neg_c, neu_label:neu_c}).set_index('Дата')
+                pos_label, neg_label, neu_label = sentiment_labels(tesa_labels)
+                date_strs, counts_list = zip(*sorted(person_s_data.items()))
+                # Все даты разбираются одним вызовом; некорректные становятся NaT и отбрасываются.
+                dates = pd.to_datetime(list(date_strs), format="%Y-%m-%d", errors="coerce")
+                valid_dates = ~dates.isna()
+                for date_str in itertools.compress(date_strs, ~valid_dates):
+                    print(f"UI WARNING: Ошибка преобразования даты '{date_str}' для графика персоны '{person_to_show}'.")
+                df_dyn = pd.DataFrame({pos_label: [counts.get(pos_label,0) for counts in counts_list],
+                                       neg_label: [counts.get(neg_label,0) for counts in counts_list],
+                                       neu_label: [counts.get(neu_label,0) for counts in counts_list]},
+                                      index=dates.rename('Дата'))[valid_dates]
+                if not df_dyn.empty:
                     st.line_chart(df_dyn, use_container_width=True)
                 else: st.write("Нет данных для построения графика динамики.")
             else: st.write("Нет данных о динамике для этой персоны.")            
             st.markdown(f"### Тексты упоминаний для: {person_to_show}")
-            p_mentions = [m for m in (detailed_mentions_data or []) if m.get("entity_normalized") == person_to_show]
-            if p_mentions:
-                max_texts_to_show_val = max(1, min(10, len(p_mentions))) 
-                max_texts_slider_max = max(25, len(p_mentions))                
-                max_texts = st.slider("Количество отображаемых текстов:", 
+            detailed_mentions_data = detailed_mentions_data or []
+            p_mention_indices = get_mentions_index_by_entity(detailed_mentions_data).get(person_to_show, [])
+            p_mentions_count = len(p_mention_indices)
+            if p_mentions_count:
+                person_key = person_to_show.replace(' ','_')
+                max_texts_to_show_val = max(1, min(10, p_mentions_count)) 
+                max_texts = st.slider("Количество текстов на странице:", 
                                       min_value=1, 
-                                      max_value=max_texts_slider_max, 
+                                      max_value=_MENTIONS_PAGE_SIZE_MAX, 
                                       value=max_texts_to_show_val, 
-                                      key=f"txt_slider_{person_to_show.replace(' ','_')}_v5")                 
-                for i,m in enumerate(p_mentions[:max_texts]):
-                    st.markdown(f"**Упоминание {i+1}**")
+                                      key=f"txt_slider_{person_key}_v5")                 
+                pages_count = (p_mentions_count + max_texts - 1) // max_texts
+                page = 1
+                if pages_count > 1:
+                    page = int(st.number_input(f"Страница (из {pages_count}):", min_value=1, max_value=pages_count,
+                                               value=1, step=1, key=f"txt_page_{person_key}_{max_texts}_v5"))
+                first_shown = (page - 1) * max_texts
+                # Разбираются и отрисовываются только упоминания текущей страницы.
+                p_mentions = [detailed_mentions_data[i] for i in p_mention_indices[first_shown:first_shown + max_texts]]
+                st.caption(f"Показаны упоминания {first_shown + 1}-{first_shown + len(p_mentions)} из {p_mentions_count}.")
+                mention_date_strs = format_mention_timestamps(p_mentions)
+                for i,m in enumerate(p_mentions):
+                    st.markdown(f"**Упоминание {first_shown + i + 1}**")
                     c1,c2,c3 = st.columns(3) 
                     with c1: st.caption(f"Тип: {m.get('source_type','N/A')}")
-                    with c2: 
-                        ts = m.get('timestamp')
-                        date_str_display = "N/A"
-                        if ts:
-                            try: date_str_display = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
-                            except: date_str_display = f"{ts} (ошибка формата)"
-                        st.caption(f"Дата: {date_str_display}")
+                    with c2: st.caption(f"Дата: {mention_date_strs[i]}")
                     with c3: st.caption(f"Тональность: {m.get('polarity','N/A')}")
                     st.markdown(f"> _{m.get('text_preview','Нет текста')}_") 
                     st.markdown("---") 
@@ -517,67 +984,78 @@ if st.session_state.app_initialization_error:
 render_sidebar()
 if st.session_state.analysis_triggered_and_pending:
     st.session_state.analysis_triggered_and_pending = False 
-    group_identifier_to_process = st.session_state.last_processed_group_input
     service = st.session_state.analysis_service_instance 
-    
-    if st.session_state.last_processed_group_name != "Не определена":
-        st.header(f"Обработка группы: {st.session_state.last_processed_group_name}")
-        if st.session_state.last_processed_start_date and st.session_state.last_processed_end_date:
-            st.subheader(f"Период: {st.session_state.last_processed_start_date.strftime('%d.%m.%Y')} - {st.session_state.last_processed_end_date.strftime('%d.%m.%Y')}")
-        st.markdown("---")
-    
     if not service:
         st.error("Сервис анализа не инициализирован. Запуск невозможен.")
     else:
-        with st.spinner(f"Идет анализ группы '{st.session_state.last_processed_group_name}' (ID/домен: {group_identifier_to_process})... Пожалуйста, подождите."):
-            try:
-                analysis_results = asyncio.run(service.run_full_analysis(
-                    group_identifiers_str=group_identifier_to_process,
-                    date_start_str=st.session_state.last_processed_start_date.strftime("%Y-%m-%d"),
-                    date_end_str=st.session_state.last_processed_end_date.strftime("%Y-%m-%d")
-                ))
-                if "error" in analysis_results: st.error(f"Ошибка анализа: {analysis_results['error']}")
-                elif "message" in analysis_results and not analysis_results.get("summary"):
-                    st.info(analysis_results['message'])
-                    st.session_state.current_summary_display = {}; st.session_state.current_detailed_mentions_display = []
-                    st.session_state.initial_summary = {}; st.session_state.initial_detailed_mentions = []
-                elif analysis_results.get("summary") is not None:
+        # Анализ выполняется в фоновом цикле событий; сессия не блокируется на время анализа.
+        if st.session_state.analysis_future is not None:
+            get_analysis_jobs().release(st.session_state.analysis_future)
+        st.session_state.analysis_future = get_analysis_jobs().submit(
+            service, st.session_state.last_processed_group_input,
+            st.session_state.last_processed_start_date.strftime("%Y-%m-%d"),
+            st.session_state.last_processed_end_date.strftime("%Y-%m-%d"))
+        st.session_state.analysis_started_at = time.monotonic()
+
+if st.session_state.analysis_stopped:
+    st.session_state.analysis_stopped = False
+    st.warning("Анализ остановлен.")
+
+analysis_future = st.session_state.analysis_future
+if analysis_future is not None and not analysis_future.done():
+    render_analysis_progress()
+elif analysis_future is not None:
+    st.session_state.analysis_future = None
+    # Отменяет запуск только AnalysisJobs.release, когда его больше не ждет ни одна сессия.
+    if not analysis_future.cancelled():
+        try:
+            analysis_results = analysis_future.result()
+            if "error" in analysis_results: st.error(f"Ошибка анализа: {analysis_results['error']}")
+            elif "message" in analysis_results and not analysis_results.get("summary"):
+                st.info(analysis_results['message'])
+                st.session_state.analysis_view = AnalysisView.of({}, [])
+            elif analysis_results.get("summary") is not None:
+                applied_analysis = st.session_state.applied_analysis
+                if applied_analysis is not None and applied_analysis[0] is analysis_results:
+                    # Повторный запуск вернул тот же результат (AnalysisJobs): подготовленные сводка
+                    # и упоминания переиспользуются, и кэши таблиц по ним остаются действительными.
+                    summary_from_backend, detailed_mentions = applied_analysis[1], applied_analysis[2]
+                else:
                     summary_from_backend = analysis_results["summary"]
+                    # Упоминания берутся из памяти бэкенда; файл читается, только если их нет в результате.
                     detailed_file = analysis_results.get("detailed_results_file")
-                    mentions_from_file, _ = load_detailed_results_from_file(detailed_file) if detailed_file else ([], [])
-                    st.session_state.initial_summary = copy.deepcopy(summary_from_backend)
-                    st.session_state.initial_detailed_mentions = copy.deepcopy(mentions_from_file)
-                    st.session_state.current_summary_display = copy.deepcopy(summary_from_backend)
-                    st.session_state.current_detailed_mentions_display = copy.deepcopy(mentions_from_file)
-                else: 
-                    st.info("Анализ завершен. Не найдено данных для отображения.")
-                    st.session_state.current_summary_display = {}; st.session_state.current_detailed_mentions_display = []
-                    st.session_state.initial_summary = {}; st.session_state.initial_detailed_mentions = []
-                
-                st.rerun() 
-
-            except Exception as e_runtime: 
-                st.error(f"Произошла непредвиденная ошибка во время выполнения анализа: {e_runtime}")
-                import traceback; st.text(traceback.format_exc())
-                st.session_state.current_summary_display = None 
-                st.session_state.initial_summary = None
-                st.rerun() 
+                    if analysis_results.get("detailed_mentions") is not None:
+                        detailed_mentions = InlineMentions(analysis_results["detailed_mentions"])
+                    else:
+                        detailed_mentions = load_detailed_results_from_file(detailed_file) if detailed_file else []
+                    st.session_state.applied_analysis = (analysis_results, summary_from_backend, detailed_mentions)
+                st.session_state.analysis_view = AnalysisView.of(summary_from_backend, detailed_mentions)
+            else: 
+                st.info("Анализ завершен. Не найдено данных для отображения.")
+                st.session_state.analysis_view = AnalysisView.of({}, [])
+        except Exception as e_runtime: 
+            st.error(f"Произошла непредвиденная ошибка во время выполнения анализа: {e_runtime}")
+            st.text(traceback.format_exc())
+            st.session_state.analysis_view = None
                 
 render_report_header()
             
-if st.session_state.current_summary_display is not None:
+analysis_view = st.session_state.analysis_view
+if analysis_view is not None:
     service_to_pass = st.session_state.analysis_service_instance 
-    render_top10_summary(st.session_state.current_summary_display, st.session_state.tesa_id2label)    
+    # Таблицы пересчитываются только при смене сводки (новый анализ, объединение, сброс),
+    # а не при каждом вводе в поиск или выборе персоны.
+    person_totals = memoize_for_object(
+        'person_totals_df', analysis_view.current_summary,
+        lambda summary: summary_to_person_totals_df(summary, st.session_state.tesa_id2label))
+    render_top10_summary(person_totals)    
     render_main_report_table_and_merge( 
-        st.session_state.current_summary_display,
-        st.session_state.current_detailed_mentions_display,
-        st.session_state.tesa_id2label,
+        analysis_view.current_summary,
+        person_totals,
         service_to_pass )
     render_person_details_expander(
-        st.session_state.current_summary_display,
-        st.session_state.current_detailed_mentions_display,
+        analysis_view.current_summary,
+        analysis_view.current_mentions,
         st.session_state.tesa_id2label)
-elif not st.session_state.analysis_triggered_and_pending and st.session_state.app_initialization_error is None:
-    st.info("Задайте параметры анализа в боковой панели и нажмите 'Начать анализ', чтобы увидеть результаты.")
-elif st.session_state.app_initialization_error:
-    st.error(f"Критическая ошибка инициализации приложения: {st.session_state.app_initialization_error}")
\ No newline at end of file
+elif not st.session_state.analysis_triggered_and_pending and st.session_state.analysis_future is None:
+    st.info("Задайте параметры анализа в боковой панели и нажмите 'Начать анализ', чтобы увидеть результаты.")
\ No newline at end of file